@@ -0,0 +1,219 @@
+"""
+Optional Numba kernels for the pixel-wise hot paths of RadScan.
+
+Numba is an optional dependency (install with `pip install radscan[fast]`). If it is not available,
+HAVE_NUMBA is False, none of the kernels are defined, and callers use their NumPy implementation.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+    logger.debug("Numba not available, using NumPy implementations.")
+
+# Arrays with fewer elements than this are not worth the kernel dispatch overhead.
+MIN_SIZE = 10_000
+
+# 1 / ln(10), so log10(x) can be evaluated as log(x) * INV_LN10
+INV_LN10 = 1.0 / np.log(10.0)
+
+# fastmath without the no-NaN/no-Inf assumptions: blank or saturated pixels yield NaN/Inf, which must propagate.
+FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+
+def check_out(out, shape, name="out"):
+    """
+    Checks an output array passed on to the kernels.
+
+    The kernels write through reshaped views and do not check bounds, so an array of another shape, or a
+    non-contiguous one (which reshape would silently copy), would leave the result unwritten or overrun.
+
+    Args:
+        out (np.ndarray): The output array.
+        shape (tuple): The required shape.
+        name (str, optional): Name of the argument in the error message. Defaults to "out".
+
+    Raises:
+        ValueError: If `out` is not a C-contiguous float array of the given shape.
+    """
+    if not isinstance(out, np.ndarray) or not np.issubdtype(out.dtype, np.floating):
+        raise ValueError(f"{name} must be a float array.")
+    if out.shape != tuple(shape):
+        raise ValueError(f"{name} has shape {out.shape}, expected {tuple(shape)}.")
+    if not out.flags.c_contiguous:
+        raise ValueError(f"{name} must be C-contiguous.")
+
+
+if HAVE_NUMBA:
+
+    @njit(parallel=True, fastmath=FASTMATH, cache=True)
+    def dose_kernel(x, a, b, c, n, out):
+        """
+        Evaluates the calibration curve a * x + b * x^c in a single pass.
+
+        Args:
+            x (np.ndarray): 1D contiguous array of NetOD values.
+            a, b, c (float): Calibration curve parameters.
+            n (int): c as a positive integer, if c is (numerically) integer, else 0. An integer exponent is
+                     evaluated by multiplications, which is much cheaper than the general power function.
+            out (np.ndarray): 1D array of the same size as x, receiving the dose values.
+        """
+        if n > 0:
+            for i in prange(x.size):
+                xi = x[i]
+                out[i] = a * xi + b * xi ** n
+        else:
+            for i in prange(x.size):
+                xi = x[i]
+                out[i] = a * xi + b * xi ** c
+
+    @njit(parallel=True, fastmath=FASTMATH, cache=True)
+    def roi_stats(arr):
+        """
+        Computes mean, sample standard deviation (ddof=1), minimum and maximum of a 2D array in one pass.
+
+        The sums are accumulated relative to the first element, which keeps the variance accurate
+        for pixel values that are large compared to their spread.
+
+        NaN values propagate as in NumPy (np.mean, np.std, np.min, np.max): if the array contains a NaN,
+        all four statistics are NaN.
+
+        Args:
+            arr (np.ndarray): 2D array with at least two elements.
+
+        Returns:
+            tuple: (mean, stddev, minval, maxval) as floats.
+        """
+        ny, nx = arr.shape
+        k = float(arr[0, 0])
+        s = 0.0
+        ss = 0.0
+        mn = np.inf
+        mx = -np.inf
+        nans = 0
+        for i in prange(ny):
+            for j in range(nx):
+                v = float(arr[i, j])
+                d = v - k
+                s += d
+                ss += d * d
+                # min() and max() would skip NaN, so NaN values are counted separately
+                mn = min(mn, v)
+                mx = max(mx, v)
+                nans += v != v
+        if nans:
+            return np.nan, np.nan, np.nan, np.nan
+        n = ny * nx
+        var = (ss - s * s / n) / (n - 1)
+        return k + s / n, np.sqrt(var), mn, mx
+
+    @njit(parallel=True, fastmath=FASTMATH, cache=True)
+    def simple_kernel(pvb, pva, spvb, spva, dn, sn):
+        """
+        Simple NetOD calculation (see NetOD.simple) in a single pass, for a 2D array of post-irradiation
+        pixel values. All other inputs are scalars.
+
+        Args:
+            pvb (float): Pixel value before irradiation.
+            pva (np.ndarray): 2D array of pixel values after irradiation.
+            spvb, spva (float): Standard errors of the pixel values.
+            dn (np.ndarray): 2D array of the same shape as pva, receiving the NetOD.
+            sn (np.ndarray or None): 2D array of the same shape as pva, receiving the standard error of the NetOD,
+                                     or None to skip the error calculation.
+        """
+        l1b = (spvb / pvb) ** 2
+
+        ny, nx = pva.shape
+        for i in prange(ny):
+            for j in range(nx):
+                v = pva[i, j]
+                dn[i, j] = np.log(pvb / v) * INV_LN10
+                if sn is not None:
+                    sn[i, j] = INV_LN10 * np.sqrt(l1b + (spva / v) ** 2)
+
+    @njit(parallel=True, fastmath=FASTMATH, cache=True)
+    def calc_kernel(pva, pvb, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk, dn, sn):
+        """
+        Full NetOD calculation with background and control correction (see NetOD.calc) in a single pass,
+        for a 2D array of post-irradiation pixel values. All other inputs are scalars.
+
+        Args:
+            pva (np.ndarray): 2D array of pixel values after irradiation.
+            pvb, pvcb, pvca, pvbk (float): Pixel values before irradiation, of the control film and of the background.
+            spvb, spva, spvcb, spvca, spvbk (float): Standard errors of the pixel values.
+            dn (np.ndarray): 2D array of the same shape as pva, receiving the NetOD.
+            sn (np.ndarray or None): 2D array of the same shape as pva, receiving the standard error of the NetOD,
+                                     or None to skip the error calculation.
+        """
+        # scalar terms, identical for all pixels
+        pvb_bk = pvb - pvbk
+        pvcb_bk = pvcb - pvbk
+        pvca_bk = pvca - pvbk
+        # log10(pvb_bk / pva_bk) - log10(pvcb_bk / pvca_bk) = log10(pvb_control / pva_bk)
+        pvb_control = pvb_bk * pvca_bk / pvcb_bk
+        l3 = (spvcb / pvcb_bk) ** 2 + (spvca / pvca_bk) ** 2
+        l4 = ((pvcb - pvca) ** 2) / (pvcb_bk * pvca_bk) ** 2 * spvbk ** 2
+        l1b = (spvb / pvb_bk) ** 2
+
+        ny, nx = pva.shape
+        for i in prange(ny):
+            for j in range(nx):
+                pva_bk = pva[i, j] - pvbk
+                dn[i, j] = np.log(pvb_control / pva_bk) * INV_LN10
+                if sn is not None:
+                    l1 = l1b + (spva / pva_bk) ** 2
+                    l2 = ((pvb - pva[i, j]) ** 2) / (pvb_bk * pva_bk) ** 2 * spvbk ** 2
+                    sn[i, j] = INV_LN10 * np.sqrt(l1 + l2 + l3 + l4)
+
+    @njit(fastmath=FASTMATH, cache=True)
+    def _calibration_curve(x, a, b, c, n):
+        """
+        Dose a * x + b * x^c of a single NetOD value x (see dose_kernel for n).
+        """
+        if n > 0:
+            return a * x + b * x ** n
+        return a * x + b * x ** c
+
+    @njit(parallel=True, fastmath=FASTMATH, cache=True)
+    def simple_dose_kernel(pvb, pva, a, b, c, n, out):
+        """
+        Simple NetOD (see simple_kernel) converted to dose (see dose_kernel) in a single pass, so the NetOD
+        map is never written to memory.
+
+        Args:
+            pvb (float): Pixel value before irradiation.
+            pva (np.ndarray): 2D array of pixel values after irradiation.
+            a, b, c (float): Calibration curve parameters.
+            n (int): c as a positive integer, if c is (numerically) integer, else 0.
+            out (np.ndarray): 2D array of the same shape as pva, receiving the dose.
+        """
+        ny, nx = pva.shape
+        for i in prange(ny):
+            for j in range(nx):
+                out[i, j] = _calibration_curve(np.log(pvb / pva[i, j]) * INV_LN10, a, b, c, n)
+
+    @njit(parallel=True, fastmath=FASTMATH, cache=True)
+    def calc_dose_kernel(pva, pvb, pvcb, pvca, pvbk, a, b, c, n, out):
+        """
+        Full NetOD (see calc_kernel) converted to dose (see dose_kernel) in a single pass, so the NetOD
+        map is never written to memory.
+
+        Args:
+            pva (np.ndarray): 2D array of pixel values after irradiation.
+            pvb, pvcb, pvca, pvbk (float): Pixel values before irradiation, of the control film and of the background.
+            a, b, c (float): Calibration curve parameters.
+            n (int): c as a positive integer, if c is (numerically) integer, else 0.
+            out (np.ndarray): 2D array of the same shape as pva, receiving the dose.
+        """
+        pvb_control = (pvb - pvbk) * (pvca - pvbk) / (pvcb - pvbk)
+
+        ny, nx = pva.shape
+        for i in prange(ny):
+            for j in range(nx):
+                out[i, j] = _calibration_curve(np.log(pvb_control / (pva[i, j] - pvbk)) * INV_LN10, a, b, c, n)
@@ -1,10 +1,18 @@
+import math
 import pickle
+import zipfile
 import numpy as np
 from scipy.optimize import curve_fit
 import logging
 
+from . import _kernels
+from .utils import get_pyplot
+
 logger = logging.getLogger(__name__)
 
+# Fitted exponents closer than this to an integer are evaluated by repeated multiplication.
+_INT_POWER_TOL = 1e-6
+
 
 class Calibration:
     """
@@ -27,7 +35,7 @@ class Calibration:
         >>> netODs = [0, 0.2, 0.4, 0.6, 0.8, 1.0]
         >>> calib = Calibration(doses, netODs, lot="12345678", channel="RED")
         >>> calib.save()
-        >>> loaded_calib = Calibration.load("ebt_calibration_lot12345678_RED.pkl")
+        >>> loaded_calib = Calibration.load("ebt_calibration_lot12345678_RED.npz")
         >>> dose = loaded_calib.dose(0.5)
         >>> print(f"Dose for NetOD 0.5: {dose} Gy")
     """
@@ -50,27 +58,62 @@ class Calibration:
         self.date = date  # Calibration date
         self.channel = channel  # Color channel used
 
-        # Fit the calibration curve to the data (NetOD vs. Dose)
-        self.fitparams, _ = curve_fit(self.func, nods, ds, p0=guess)
-        self.fitstr = f"Fit Dw = {self.fitparams[0]:.3f} * netOD + {self.fitparams[1]:.3f} * \
-            netOD^{self.fitparams[2]:.3f}"
+        self._fit(guess)
+
+    @classmethod
+    def from_fitparams(cls, fitparams, ds=(), nods=(), lot="00000000", date="", channel='RED'):
+        """
+        Creates a Calibration object from already fitted parameters, without fitting the curve again.
+
+        Args:
+            fitparams (sequence): Parameters of the fitted calibration curve (a, b, c).
+            ds (list or np.ndarray, optional): List of doses (in Gy) the curve was fitted to. Defaults to none.
+            nods (list or np.ndarray, optional): List of corresponding NetOD values. Defaults to none.
+            lot (str, optional): Lot number for the EBT film batch. Defaults to "00000000".
+            date (str, optional): Calibration date. Defaults to an empty string.
+            channel (str, optional): Color channel used for calibration. Defaults to 'RED'.
+
+        Returns:
+            Calibration: The calibration object.
+        """
+        calib = cls.__new__(cls)
+        calib.ds = np.asarray(ds)
+        calib.nods = np.asarray(nods)
+        calib.lot = lot
+        calib.date = date
+        calib.channel = channel
+        calib.fitparams = np.asarray(fitparams, dtype=float)
+        calib.fitstr = _fit_string(calib.fitparams)
+        return calib
+
+    def _fit(self, guess):
+        """
+        Fits the calibration curve to the data (NetOD vs. Dose) and sets fitparams and fitstr.
+
+        Args:
+            guess (tuple): Initial guess for the curve fitting parameters (a, b, c).
+        """
+        self.fitparams, _ = curve_fit(self.func, self.nods, self.ds, p0=guess, jac=self.dfunc)
+        self.fitstr = _fit_string(self.fitparams)
 
     def save(self, filename=None):
         """
-        Saves the calibration object to disk using pickle.
+        Saves the calibration object to disk as a NumPy .npz archive.
 
         Args:
             filename (str, optional): Filename to save the calibration object. Defaults to
-                                      'ebt_calibration_lot{lot_number}_{channel}.pkl'.
+                                      'ebt_calibration_lot{lot_number}_{channel}.npz'.
 
         Note:
-            The object is saved using pickle with the highest protocol available (`pickle.HIGHEST_PROTOCOL`).
+            The archive holds the data points, the fitted parameters and the lot, date and channel strings.
+            It is written to `filename` as given, i.e. no '.npz' suffix is appended.
         """
         if not filename:
-            filename = f"ebt_calibration_lot{self.lot}_{self.channel}.pkl"
+            filename = f"ebt_calibration_lot{self.lot}_{self.channel}.npz"
         with open(filename, 'wb') as f:
             logging.debug(f"Saving calibration to {filename}")
-            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+            np.savez(f, ds=self.ds, nods=self.nods, fitparams=self.fitparams,
+                     lot=np.array(self.lot), date=np.array(self.date), channel=np.array(self.channel))
 
     def plot(self, netODmin=0, netODmax=1.1, save=None):
         """
@@ -81,7 +124,7 @@ class Calibration:
             netODmax (float, optional): The maximum NetOD value to plot. Defaults to 2.0.
             save (str, optional): If provided, saves the plot to the specified file. Otherwise, displays the plot.
         """
-        import matplotlib.pyplot as plt
+        plt = get_pyplot()
         # Generate a range of NetOD values for the plot
         netOD_values = np.linspace(netODmin, netODmax, 100)
         dose_values = self.dose(netOD_values)
@@ -108,8 +151,10 @@ class Calibration:
     @staticmethod
     def load(filename):
         """
-        Loads a saved calibration object from disk using the custom unpickler to handle
-        renamed modules.
+        Loads a saved calibration object from disk.
+
+        Files written by save() are .npz archives and are loaded without refitting. Older pickled
+        calibration files are still supported, using the custom unpickler to handle renamed modules.
 
         Args:
             filename (str): The path to the calibration file.
@@ -119,10 +164,13 @@ class Calibration:
 
         Raises:
             FileNotFoundError: If the specified file does not exist.
-            pickle.UnpicklingError: If loading the file fails.
+            pickle.UnpicklingError: If loading a pickled file fails.
+            ValueError: If loading an .npz file fails.
         """
         logging.debug(f"Loading calibration from {filename}")
         try:
+            if zipfile.is_zipfile(filename):
+                return Calibration._load_npz(filename)
             with open(filename, 'rb') as f:
                 return CustomUnpickler(f).load()
         except FileNotFoundError as e:
@@ -131,6 +179,26 @@ class Calibration:
         except (pickle.UnpicklingError, EOFError) as e:
             logger.error(f"Error loading file: {filename}. Reason: {e}")
             raise e
+        except (KeyError, ValueError, zipfile.BadZipFile) as e:
+            logger.error(f"Error loading file: {filename}. Reason: {e}")
+            raise ValueError(f"Invalid calibration file: {filename}") from e
+
+    @staticmethod
+    def _load_npz(filename):
+        """
+        Restores a calibration object from an .npz archive written by save(), without refitting.
+
+        Args:
+            filename (str): The path to the calibration file.
+
+        Returns:
+            Calibration: The loaded calibration object.
+        """
+        with np.load(filename) as data:
+            # .item() returns plain Python values; channel is an int in files converted from old pickles
+            return Calibration.from_fitparams(data['fitparams'], data['ds'], data['nods'],
+                                              lot=data['lot'].item(), date=data['date'].item(),
+                                              channel=data['channel'].item())
 
     @staticmethod
     def func(netOD, a=20, b=40, c=3):
@@ -149,18 +217,127 @@ class Calibration:
         """
         return a * netOD + b * np.power(netOD, c)
 
-    def dose(self, netOD):
+    @staticmethod
+    def dfunc(netOD, a=20, b=40, c=3):
+        """
+        The Jacobian of the calibration function with respect to its parameters (a, b, c).
+        Passed to curve_fit, so the Jacobian need not be estimated by finite differences.
+
+        Args:
+            netOD (float or np.ndarray): Net Optical Density, as a 1D array of N values.
+            a (float, optional): Fitted parameter. Defaults to 20.
+            b (float, optional): Fitted parameter. Defaults to 40.
+            c (float, optional): Fitted parameter. Defaults to 3.
+
+        Returns:
+            np.ndarray: An (N, 3) array holding the partial derivatives d(Dw)/da, d(Dw)/db and d(Dw)/dc.
+        """
+        netOD = np.asarray(netOD, dtype=float)
+        p = np.power(netOD, c)
+        # d(x^c)/dc = x^c * log(x), taken as 0 at netOD = 0 (instead of 0 * -inf). For negative netOD, x^c is
+        # only real at integer c and has no derivative in c: the NaN makes curve_fit fail, as it does with
+        # finite differences, instead of silently stopping at the initial guess.
+        log_x = np.full_like(netOD, np.nan)
+        np.log(netOD, out=log_x, where=netOD > 0)
+        log_x[netOD == 0] = 0.0
+        return np.column_stack((netOD, p, b * p * log_x))
+
+    def dose(self, netOD, out=None):
         """
         Calculates the dose (in Gy) for a given NetOD value using the fitted calibration curve.
 
         Args:
             netOD (float or np.ndarray): The NetOD value(s) to convert to dose. Can be a scalar or an array.
+            out (np.ndarray, optional): C-contiguous float array of the shape of netOD, receiving the dose.
+                                        May be netOD itself, to convert a NetOD map in place.
 
         Returns:
-            float or np.ndarray: The corresponding dose in Gy.
+            float or np.ndarray: The corresponding dose in Gy (`out`, if given). Float32 NetOD arrays yield float32
+                                 doses, any other input float64.
+
+        Raises:
+            ValueError: If `out` is not a C-contiguous float array of the shape of netOD.
         """
+        if np.isscalar(netOD) and out is None:
+            # Plain float math is much cheaper than NumPy ufunc dispatch for a single value (e.g. per-ROI doses)
+            a, b, c = self.fitparams.tolist()
+            try:
+                return np.float64(a * netOD + b * math.pow(netOD, c))
+            except (ValueError, OverflowError):
+                pass  # e.g. negative or huge netOD: let NumPy return NaN or inf as for arrays
+
         netOD = np.asarray(netOD)
-        return self.func(netOD, *self.fitparams)
+        if out is not None:
+            _kernels.check_out(out, netOD.shape)
+        # Python floats, so float32 NetOD arrays are not promoted to float64
+        a, b, c = self.fitparams.tolist()
+
+        if _kernels.HAVE_NUMBA and netOD.size >= _kernels.MIN_SIZE:
+            x = np.ascontiguousarray(netOD, dtype=np.result_type(netOD, 1.0))
+            dose = np.empty_like(x) if out is None else out
+            _kernels.dose_kernel(x.ravel(), a, b, c, _integer_exponent(c), dose.reshape(-1))
+            return dose
+
+        # Same as self.func(netOD, a, b, c), but without the temporaries of the generic expression.
+        dose = _power(netOD, c)
+        dose *= b
+        dose += a * netOD
+        if out is not None:
+            out[...] = dose
+            return out
+        return dose
+
+
+def _fit_string(fitparams):
+    """
+    Returns a string representation of the fitted calibration equation.
+
+    Args:
+        fitparams (sequence): The fitted parameters (a, b, c).
+
+    Returns:
+        str: The calibration equation with the fitted parameters.
+    """
+    a, b, c = fitparams
+    return f"Fit Dw = {a:.3f} * netOD + {b:.3f} * netOD^{c:.3f}"
+
+
+def _integer_exponent(c):
+    """
+    Returns the exponent c as an integer, if it is (numerically) a positive integer.
+
+    Args:
+        c (float): Exponent.
+
+    Returns:
+        int: round(c), or 0 if c is not close to a positive integer.
+    """
+    n = round(c)
+    return n if n >= 1 and abs(c - n) <= _INT_POWER_TOL else 0
+
+
+def _power(x, c):
+    """
+    Evaluates x**c for a fixed exponent c.
+
+    If c is (numerically) a small positive integer, the power is computed by repeated multiplication,
+    which avoids the exp(c * log(x)) evaluation np.power performs for float exponents.
+
+    Args:
+        x (np.ndarray): Base values.
+        c (float): Exponent.
+
+    Returns:
+        np.ndarray: x**c as a new float array (float32 for float32 x, else float64).
+    """
+    dtype = np.result_type(x, 1.0)
+    n = _integer_exponent(c)
+    if not n:
+        return np.power(x, c, dtype=dtype)
+    out = np.array(x, dtype=dtype)
+    for _ in range(n - 1):
+        out *= x
+    return out if out.ndim else out[()]
 
 
 # fix for old pickle files:import pickle
@@ -175,8 +352,7 @@ class CustomUnpickler(pickle.Unpickler):
 
 def load(filename):
     """
-    Loads a saved calibration object from disk using the custom unpickler to handle
-    renamed modules.
+    Loads a saved calibration object from disk, see Calibration.load().
 
     Args:
         filename (str): The path to the calibration file.
@@ -184,6 +360,4 @@ def load(filename):
     Returns:
         Calibration: The loaded calibration object.
     """
-    logging.debug(f"Loading calibration from {filename}")
-    with open(filename, 'rb') as f:
-        return CustomUnpickler(f).load()
+    return Calibration.load(filename)
@@ -1,10 +1,24 @@
+import os
+import copy
+import hashlib
+import itertools
+import tempfile
 import tifffile
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
+from . import _kernels
+from .utils import get_pyplot
+
 logger = logging.getLogger(__name__)
 
+# TIFF tags copied into RSImage.metadata. Other tags, such as ICC profiles or XMP packets, can be large and are unused.
+METADATA_TAGS = ('ImageWidth', 'ImageLength', 'BitsPerSample', 'SamplesPerPixel', 'Compression',
+                 'PhotometricInterpretation', 'XResolution', 'YResolution', 'ResolutionUnit',
+                 'Make', 'Model', 'Software', 'DateTime')
+
 
 class RSImage:
     """
@@ -17,13 +31,33 @@ class RSImage:
                             depending on the resolution and bit depth of the TIFF file.
                             For color images, the shape is typically (height, width, channels),
                             where channels correspond to Red, Green, and Blue (RGB).
-        metadata (dict): A dictionary containing TIFF metadata extracted from the file.
+                            Single uncompressed TIFF files are memory-mapped copy-on-write, so only the
+                            pixels actually accessed are read from disk. The array can be modified in place,
+                            changes are kept in memory and never written to the file.
+                            The average of several files is stored as float32.
+                            In-memory color images are stored plane by plane (i.e. the (height, width, channels)
+                            array is a view of a (channels, height, width) buffer), so that a single channel
+                            `image[:, :, channel]` is a contiguous array.
+        metadata (dict): A dictionary containing TIFF metadata extracted from the (first) file.
                          This includes information like resolution, bit depth, compression, etc.
+                         Only the tags listed in METADATA_TAGS are extracted, on first access.
 
     Methods:
         analyze(rois=None, channel=0):
             Analyzes the image within specified ROIs or self.rois and computes statistics for each ROI.
 
+        roi_stats(rois=None, channel=0):
+            Same statistics as analyze(), returned as one array per statistic.
+
+        roi_means(rois=None, channel=0):
+            Only the mean pixel value of each ROI, as an array.
+
+        channel(channel=0):
+            Returns a single color channel of the image as a contiguous 2D array.
+
+        with_rois(rois):
+            Returns a copy with other ROIs, sharing the pixel data.
+
         show(channel=0):
             Displays the entire image using matplotlib.
 
@@ -31,59 +65,144 @@ class RSImage:
             Displays the image for each specified ROI or self.rois using matplotlib.
     """
 
-    def __init__(self, fn, rois=None):
+    def __init__(self, fn, rois=None, cache_dir=None):
         """
-        Initializes the RSImage class by loading one or more TIFF images, extracting metadata,
-        and optionally setting ROIs.
+        Initializes the RSImage class by loading one or more TIFF images, and optionally setting ROIs.
+        The metadata is only read from the file when it is first accessed.
 
         Args:
             fn (str or list): The path to the TIFF image file, or a list of file paths to average.
             rois (list, optional): A list of tuples specifying Regions of Interest (ROIs) as (xmin, xmax, ymin, ymax).
                                    Defaults to an empty list if no ROI is provided.
+            cache_dir (str, optional): Directory for caching averaged images, e.g. '~/.cache/radscan'.
+                                       If given, the average of a list of files is saved there as .npy file,
+                                       and later runs memory-map it instead of decoding the TIFF files again,
+                                       as long as the files are unchanged. Defaults to no caching.
         """
         self.fn = fn
         self.rois = rois if rois is not None else []
+        self._metadata = None
+        self._channels = {}
 
         if isinstance(fn, list):
             # Load multiple images and compute the average
-            self.image, self.metadata = self._load_and_average_images(fn)
+            if cache_dir:
+                self.image = self._load_cached_average(fn, cache_dir)
+            else:
+                self.image = self._load_and_average_images(fn)
         else:
             # Load a single image
             with tifffile.TiffFile(fn) as tif:
-                self.image = tif.asarray()
-                self.metadata = {
-                    tag.name: tag.value for tag in tif.pages[0].tags}
+                self.image = _memmap_tiff(fn) if tif.pages[0].is_memmappable else None
+                if self.image is None:
+                    # Compressed strips or tiles are decoded on all cores (tifffile uses only half by default)
+                    self.image = _to_planar(tif.asarray(maxworkers=os.cpu_count()))
 
         # Log metadata for debugging purposes
         logger.debug(f"Loaded TIFF file(s): {self.fn}")
-        logger.debug("Metadata:")
-        for key, value in self.metadata.items():
-            logger.debug(f"{key}: {value}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Metadata:")
+            for key, value in self.metadata.items():
+                logger.debug(f"{key}: {value}")
+
+    @property
+    def metadata(self):
+        """
+        dict: TIFF metadata of the (first) image file, read from the file on first access.
+        """
+        if self._metadata is None:
+            fn = self.fn[0] if isinstance(self.fn, list) else self.fn
+            with tifffile.TiffFile(fn) as tif:
+                self._metadata = _read_metadata(tif.pages[0])
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata):
+        self._metadata = metadata
 
     def _load_and_average_images(self, file_list):
         """
-        Load multiple TIFF images, compute the average, and return the averaged image and metadata.
+        Load multiple TIFF images, compute the average, and return the averaged image.
 
         Args:
             file_list (list): A list of file paths to TIFF images.
 
         Returns:
-            tuple: Averaged image as a NumPy array, and metadata from the first image.
+            np.ndarray: Averaged image as a float32 NumPy array.
         """
-        images = []
-        for fn in file_list:
-            with tifffile.TiffFile(fn) as tif:
-                images.append(tif.asarray())
-            logger.debug(f"Loaded image: {fn}")
+        # Decode several files concurrently (tifffile releases the GIL while decoding), but only keep
+        # as many decoded images in memory as there are workers. Each worker decodes into its own buffer,
+        # which is allocated once and reused for every batch. The cores are shared out between the files,
+        # instead of each tifffile.imread starting its own threads on top of the file-level workers.
+        cpus = os.cpu_count() or 1
+        workers = min(len(file_list), cpus)
+        threads_per_file = max(1, cpus // workers)
+        with tifffile.TiffFile(file_list[0]) as tif:
+            series = tif.series[0]
+            buffers = [np.empty(series.shape, dtype=series.dtype) for _ in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def decoded():
+                for i in range(0, len(file_list), workers):
+                    batch = file_list[i:i + workers]
+                    futures = [executor.submit(tifffile.imread, fn, out=buffer, maxworkers=threads_per_file)
+                               for fn, buffer in zip(batch, buffers)]
+                    for fn, future in zip(batch, futures):
+                        image = future.result()
+                        logger.debug(f"Loaded image: {fn}")
+                        yield image
+
+            images = decoded()
+            first = next(images)
+            sum_dtype = _accumulator_dtype(first.dtype, len(file_list))
+            if np.issubdtype(sum_dtype, np.integer):
+                # Integer scans are summed exactly, in a running sum
+                total = _to_planar(first, dtype=sum_dtype)
+                for image in images:
+                    total += image
+            else:
+                total = _pairwise_sum(itertools.chain([first], images))
 
         # Compute the average image over all loaded images
-        average_image = np.mean(np.stack(images), axis=0)
+        average_image = np.divide(total, len(file_list), dtype=np.float32)
 
-        # Use metadata from the first image
-        with tifffile.TiffFile(file_list[0]) as tif:
-            metadata = {tag.name: tag.value for tag in tif.pages[0].tags}
+        return average_image
 
-        return average_image, metadata
+    def _load_cached_average(self, file_list, cache_dir):
+        """
+        Returns the average of the TIFF images from the cache directory, computing and caching it if needed.
+
+        The cache key is a hash of the paths, sizes and modification times of the files, so changed files
+        are averaged again. The cached file holds the planar (channels, height, width) buffer, and is
+        memory-mapped copy-on-write, so the cache file is never modified.
+
+        Args:
+            file_list (list): A list of file paths to TIFF images.
+            cache_dir (str): The cache directory; created if it does not exist.
+
+        Returns:
+            np.ndarray: Averaged image as a float32 NumPy array.
+        """
+        key = hashlib.sha1()
+        for fn in file_list:
+            stat = os.stat(fn)
+            key.update(f"{os.path.abspath(fn)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+        cache_dir = os.path.expanduser(cache_dir)
+        cache_file = os.path.join(cache_dir, f"{key.hexdigest()}.npy")
+
+        if not os.path.exists(cache_file):
+            image = self._load_and_average_images(file_list)
+            planes = image.transpose(2, 0, 1) if image.ndim == 3 else image
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file first, so no other process ever sees a partially written cache file
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as f:
+                np.save(f, np.ascontiguousarray(planes))
+            os.replace(f.name, cache_file)
+            logger.debug(f"Cached averaged image in {cache_file}")
+        else:
+            logger.debug(f"Loading cached averaged image from {cache_file}")
+
+        planes = np.load(cache_file, mmap_mode='c')
+        return planes.transpose(1, 2, 0) if planes.ndim == 3 else planes
 
     def analyze(self, rois=None, channel=0, single=False):
         """
@@ -100,35 +219,162 @@ class RSImage:
             list or tuple: If single=False, returns a list of (mean, stderr, minval, maxval) for each ROI.
                         If single=True, returns a tuple (mean, stderr, minval, maxval) averaged over all ROIs.
         """
+        means, stderrs, minvals, maxvals = self.roi_stats(rois, channel)
+
+        # If single=True, return a single averaged result over all ROIs
+        if single:
+            return (np.mean(means), np.mean(stderrs), np.min(minvals), np.max(maxvals))
+
+        return list(zip(means, stderrs, minvals, maxvals))
+
+    def roi_stats(self, rois=None, channel=0):
+        """
+        Computes the statistics of all or selected ROIs, as one array per statistic.
 
+        This is the array form of analyze(), for code which processes all ROIs at once.
+
+        Args:
+            rois (list, optional): A list of tuples specifying ROIs as (xmin, xmax, ymin, ymax).
+                                If None, the method will use self.rois.
+            channel (int): The color channel to analyze. Default is 0 (Red for color images).
+
+        Returns:
+            tuple: Arrays (means, stderrs, minvals, maxvals), each with one element per ROI.
+                   Means and standard errors are float64, minima and maxima have the image dtype.
+                   All four statistics of an ROI containing a NaN pixel are NaN (as for np.mean and np.min).
+
+        Raises:
+            ValueError: If no ROIs are given, or an ROI is out of image bounds.
+        """
         rois_to_analyze = rois if rois is not None else self.rois
 
         if not rois_to_analyze:
             raise ValueError("No ROIs provided or available in self.rois.")
 
-        results = []
-        for roi in rois_to_analyze:
-            xmin, xmax, ymin, ymax = roi
-            if xmin < 0 or xmax > self.image.shape[1] or ymin < 0 or ymax > self.image.shape[0]:
-                raise ValueError(f"ROI {roi} is out of image bounds.")
+        rois_arr = self._check_rois(rois_to_analyze)
+
+        widths = rois_arr[:, 1] - rois_arr[:, 0]
+        heights = rois_arr[:, 3] - rois_arr[:, 2]
+        width, height = int(widths[0]), int(heights[0])
+        uniform = bool((widths == width).all() and (heights == height).all())
+        use_kernel = _kernels.HAVE_NUMBA and width * height >= _kernels.MIN_SIZE
+
+        if len(rois_to_analyze) > 1 and uniform and not use_kernel:
+            # Equally sized ROIs (e.g. calibration strips): reduce all of them in one call per statistic
+            stack = np.stack([self.image[ymin:ymax, xmin:xmax, channel]
+                              for xmin, xmax, ymin, ymax in rois_to_analyze])
+            means = np.mean(stack, axis=(1, 2), dtype=np.float64)
+            stderrs = np.std(stack, axis=(1, 2), ddof=1, dtype=np.float64) / np.sqrt(width * height)
+            return means, stderrs, np.min(stack, axis=(1, 2)), np.max(stack, axis=(1, 2))
+
+        n = len(rois_to_analyze)
+        means = np.empty(n)
+        stderrs = np.empty(n)
+        minvals = np.empty(n, dtype=self.image.dtype)
+        maxvals = np.empty(n, dtype=self.image.dtype)
+        for i, (xmin, xmax, ymin, ymax) in enumerate(rois_to_analyze):
+            _imc = self.image[ymin:ymax, xmin:xmax, channel]
+            if _kernels.HAVE_NUMBA and _imc.size >= _kernels.MIN_SIZE:
+                # all four statistics in a single pass over the ROI pixels
+                mean, stddev, minvals[i], maxvals[i] = _kernels.roi_stats(_imc)
+            else:
+                mean = np.mean(_imc, dtype=np.float64)
+                stddev = np.std(_imc, ddof=1, dtype=np.float64)
+                minvals[i], maxvals[i] = np.min(_imc), np.max(_imc)
+            means[i] = mean
+            stderrs[i] = stddev / np.sqrt(np.size(_imc))
+
+        return means, stderrs, minvals, maxvals
+
+    def roi_means(self, rois=None, channel=0):
+        """
+        Computes only the mean pixel value of all or selected ROIs.
 
-            _image = self.image[ymin:ymax, xmin:xmax, :]
-            _imc = _image[:, :, channel]
-            mean = np.mean(_imc)
-            stddev = np.std(_imc, ddof=1)
-            stderr = stddev / np.sqrt(np.size(_imc))
+        Cheaper than roi_stats(), for code which does not need the standard errors or extreme values:
+        each ROI is read once, by a single summation.
 
-            results.append((mean, stderr, np.min(_imc), np.max(_imc)))
+        Args:
+            rois (list, optional): A list of tuples specifying ROIs as (xmin, xmax, ymin, ymax).
+                                If None, the method will use self.rois.
+            channel (int): The color channel to analyze. Default is 0 (Red for color images).
 
-        # If single=True, return a single averaged result over all ROIs
-        if single:
-            means = [r[0] for r in results]
-            stderrs = [r[1] for r in results]
-            minvals = [r[2] for r in results]
-            maxvals = [r[3] for r in results]
-            return (np.mean(means), np.mean(stderrs), np.min(minvals), np.max(maxvals))
+        Returns:
+            np.ndarray: Float64 array of the mean pixel values, one per ROI.
+
+        Raises:
+            ValueError: If no ROIs are given, or an ROI is out of image bounds.
+        """
+        rois_to_analyze = rois if rois is not None else self.rois
+
+        if not rois_to_analyze:
+            raise ValueError("No ROIs provided or available in self.rois.")
+
+        rois_arr = self._check_rois(rois_to_analyze)
+
+        means = np.empty(len(rois_arr))
+        for i, (xmin, xmax, ymin, ymax) in enumerate(rois_arr.tolist()):
+            means[i] = np.mean(self.image[ymin:ymax, xmin:xmax, channel], dtype=np.float64)
+        return means
+
+    def _check_rois(self, rois):
+        """
+        Checks that all ROIs lie within the image bounds.
+
+        Args:
+            rois (list): A list of tuples specifying ROIs as (xmin, xmax, ymin, ymax).
 
-        return results
+        Returns:
+            np.ndarray: The ROIs as an (N, 4) integer array.
+
+        Raises:
+            ValueError: If an ROI is out of image bounds.
+        """
+        rois_arr = np.asarray(rois, dtype=np.int64).reshape(-1, 4)
+        height, width = self.image.shape[:2]
+        outside = ((rois_arr[:, 0] < 0) | (rois_arr[:, 1] > width) |
+                   (rois_arr[:, 2] < 0) | (rois_arr[:, 3] > height))
+        if outside.any():
+            raise ValueError(f"ROI {rois[int(np.argmax(outside))]} is out of image bounds.")
+        return rois_arr
+
+    def channel(self, channel=0):
+        """
+        Returns a single color channel of the image as a contiguous 2D array.
+
+        Channels of in-memory color images are contiguous views already (see the image attribute). The channel of
+        a memory-mapped, pixel-interleaved file is copied on first use, so that repeated full-image analyses of it
+        read contiguous memory instead of every third (or fourth) value.
+
+        Args:
+            channel (int): The color channel. Default is 0 (Red for color images).
+
+        Returns:
+            np.ndarray: A (height, width) array, shared between calls (do not modify).
+        """
+        if self.image.ndim == 2:
+            return self.image
+        plane = self.image[:, :, channel]
+        if plane.flags.c_contiguous:
+            return plane
+        if channel not in self._channels:
+            self._channels[channel] = np.ascontiguousarray(plane)
+        return self._channels[channel]
+
+    def with_rois(self, rois):
+        """
+        Returns a copy of the image with other ROIs attached, e.g. for control films on the same scan.
+
+        The copy shares the pixel data (and metadata) with this image, so no image data is copied.
+
+        Args:
+            rois (list): A list of tuples specifying ROIs as (xmin, xmax, ymin, ymax).
+
+        Returns:
+            RSImage: The new image object.
+        """
+        image = copy.copy(self)
+        image.rois = rois
+        return image
 
     def show(self, channel=0):
         """
@@ -138,7 +384,7 @@ class RSImage:
             channel (int, optional): The color channel to display. Default is 0 (Red for color images).
         """
 
-        import matplotlib.pyplot as plt
+        plt = get_pyplot()
 
         _image = self.image[:, :, channel]
         plt.imshow(_image)
@@ -156,18 +402,17 @@ class RSImage:
             channel (int, optional): The color channel to display. Default is 0 (Red for color images).
         """
 
-        import matplotlib.pyplot as plt
+        plt = get_pyplot()
 
         rois_to_show = rois if rois is not None else self.rois
 
         if not rois_to_show:
             raise ValueError("No ROIs provided or available in self.rois.")
 
+        self._check_rois(rois_to_show)
+
         for roi in rois_to_show:
             xmin, xmax, ymin, ymax = roi
-            if xmin < 0 or xmax > self.image.shape[1] or ymin < 0 or ymax > self.image.shape[0]:
-                raise ValueError(f"ROI {roi} is out of image bounds.")
-
             _image = self.image[ymin:ymax, xmin:xmax, :]
             _imc = _image[:, :, channel]
 
@@ -175,3 +420,113 @@ class RSImage:
             plt.title(f"ROI: {roi}")
             plt.colorbar(label="Pixel Values")
             plt.show()
+
+
+def _memmap_tiff(fn):
+    """
+    Memory-maps the image data of an uncompressed TIFF file copy-on-write.
+
+    Args:
+        fn (str): The path to the TIFF file.
+
+    Returns:
+        np.memmap or None: The image data, or None if it cannot be memory-mapped, e.g. if the pages of a series
+                           are not stored contiguously.
+    """
+    try:
+        return tifffile.memmap(fn, mode='c')
+    except ValueError as e:
+        logger.debug(f"Cannot memory-map {fn}, reading it instead: {e}")
+        return None
+
+
+def _read_metadata(page):
+    """
+    Extracts the tags listed in METADATA_TAGS from a TIFF page.
+
+    Args:
+        page (tifffile.TiffPage): The TIFF page.
+
+    Returns:
+        dict: Tag names mapped to their values, for the tags present in the page.
+    """
+    tags = page.tags
+    return {name: tags[name].value for name in METADATA_TAGS if name in tags}
+
+
+def _to_planar(image, dtype=None):
+    """
+    Copies a color image into planar memory layout.
+
+    The returned array has the same (height, width, channels) shape and values as `image`, but is a view
+    of a (channels, height, width) buffer, so that `image[:, :, channel]` is contiguous.
+    Images which are not 3-channel or 4-channel color images are returned unchanged (unless a dtype is given).
+
+    Args:
+        image (np.ndarray): The image.
+        dtype (np.dtype, optional): The dtype of the returned array. Defaults to the dtype of `image`.
+
+    Returns:
+        np.ndarray: The image in planar layout.
+    """
+    if image.ndim != 3 or image.shape[-1] not in (3, 4):
+        return image if dtype is None else image.astype(dtype)
+    planes = np.empty((image.shape[2],) + image.shape[:2], dtype=dtype or image.dtype)
+    planes[...] = image.transpose(2, 0, 1)
+    return planes.transpose(1, 2, 0)
+
+
+def _accumulator_dtype(dtype, n):
+    """
+    Chooses the dtype for summing n images of the given dtype.
+
+    Integer images are summed exactly, in the smallest integer type of at least the same size that
+    cannot overflow (e.g. uint32 for up to 65537 16-bit scans). Other images are summed as float32.
+
+    Args:
+        dtype (np.dtype): The dtype of the images.
+        n (int): The number of images.
+
+    Returns:
+        np.dtype: The dtype of the sum.
+    """
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        candidates = (np.uint16, np.uint32, np.uint64) if info.min >= 0 else (np.int16, np.int32, np.int64)
+        for candidate in map(np.dtype, candidates):
+            limits = np.iinfo(candidate)
+            if candidate.itemsize >= dtype.itemsize and limits.min <= n * info.min and n * info.max <= limits.max:
+                return candidate
+    return np.dtype(np.float32)
+
+
+def _pairwise_sum(images):
+    """
+    Sums images by pairwise (tree) summation, consuming them one at a time.
+
+    Partial sums of 1, 2, 4, ... images are kept on a stack, and two partial sums of the same size are
+    merged as soon as both exist. This gives the accuracy of pairwise summation while at most
+    log2(N) + 1 partial sums are held in memory, and each decoded image can be released right away.
+
+    Args:
+        images (iterable): The images to sum, all of the same shape.
+
+    Returns:
+        np.ndarray: The sum as a float32 array in planar layout (see _to_planar).
+    """
+    stack = []  # (number of images, partial sum)
+    for image in images:
+        count, total = 1, image
+        while stack and stack[-1][0] == count:
+            n, partial = stack.pop()
+            partial += total
+            count, total = count + n, partial
+        if count == 1:
+            total = _to_planar(image, dtype=np.float32)
+        stack.append((count, total))
+
+    _, total = stack.pop()
+    while stack:
+        total += stack.pop()[1]
+    return total
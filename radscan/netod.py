@@ -1,8 +1,20 @@
+import math
 import numpy as np
 import logging
 
+from . import _kernels
+
 logger = logging.getLogger(__name__)
 
+try:
+    import numexpr
+    HAVE_NUMEXPR = True
+except ImportError:
+    HAVE_NUMEXPR = False
+
+# log10(x) is evaluated as log(x) * _INV_LN10, which is cheaper than np.log10 for large arrays
+_INV_LN10 = 1.0 / math.log(10.0)
+
 
 class NetOD:
     """
@@ -20,6 +32,7 @@ class NetOD:
         pvbk (float, optional): Background pixel value (scalar).
         spvb (float, optional): Standard error of pvb (scalar).
         spva (float or np.ndarray, optional): Standard error of pva (scalar or 2D array).
+                                              Arrays of pva and spva are stored as float32.
         spvcb (float, optional): Standard error of pvcb (scalar).
         spvca (float, optional): Standard error of pvca (scalar).
         spvbk (float, optional): Standard error of pvbk (scalar).
@@ -50,14 +63,16 @@ class NetOD:
             spvbk (float, optional): Standard error of pvbk (scalar).
             simplified (bool): Whether to use the simplified NetOD calculation. Defaults to True.
         """
-        self.pvb = np.asarray(pvb)
-        self.pva = np.asarray(pva)
-        self.pvcb = np.asarray(pvcb) if pvcb is not None else None
-        self.pvca = np.asarray(pvca) if pvca is not None else None
-        self.pvbk = np.asarray(pvbk) if pvbk is not None else None
+        # Plain Python numbers are kept as they are, as float arithmetic is much faster than on 0-d arrays
+        self.pvb = _as_value(pvb)
+        # Pixel value images are stored as float32: ample precision, and half the memory traffic of float64
+        self.pva = _as_float32_image(pva)
+        self.pvcb = _as_value(pvcb) if pvcb is not None else None
+        self.pvca = _as_value(pvca) if pvca is not None else None
+        self.pvbk = _as_value(pvbk) if pvbk is not None else None
 
         self.spvb = spvb
-        self.spva = np.asarray(spva)
+        self.spva = _as_float32_image(spva)
         self.spvcb = spvcb
         self.spvca = spvca
         self.spvbk = spvbk
@@ -65,7 +80,7 @@ class NetOD:
         self.simplified = simplified
 
     @staticmethod
-    def simple(pvb, pva, spvb=0, spva=0):
+    def simple(pvb, pva, spvb=0, spva=0, out=None, compute_stderr=True):
         """
         Simple calculation of Net Optical Density (NetOD), typically used when no background correction is needed.
 
@@ -74,17 +89,36 @@ class NetOD:
             pva (float or np.ndarray): Pixel value after irradiation. Can be scalar (ROI) or 2D array (full image).
             spvb (float, optional): Standard error of pvb (scalar). Defaults to 0.
             spva (float or np.ndarray, optional): Standard error of pva. Can be scalar or 2D array. Defaults to 0.
+            out (np.ndarray, optional): Float64 (or float32) array of the shape of the result, receiving the NetOD.
+            compute_stderr (bool, optional): If False, the standard error is not calculated. Defaults to True.
 
         Returns:
             tuple: NetOD and its standard error. If `pva` is a 2D array, NetOD is returned as a 2D array.
+                   If given, `out` is returned. The standard error is None if `compute_stderr` is False.
+
+        Raises:
+            ValueError: If `out` for a full image is not a C-contiguous float array of the shape of pva.
         """
-        dn = np.log10(pvb / pva)
-        sn = (1.0 / np.log(10.0)) * \
-            np.sqrt((spvb / pvb) ** 2 + (spva / pva) ** 2)
-        return dn, sn
+        full_image = np.size(pva) >= _kernels.MIN_SIZE and all(np.ndim(v) == 0 for v in (pvb, spvb, spva))
+        if full_image and out is not None:
+            _kernels.check_out(out, np.shape(pva))
+        if full_image and _kernels.HAVE_NUMBA and np.ndim(pva) in (1, 2):
+            # Full image: NetOD and its error in one pass; the compiled kernel is cached on disk between runs
+            pva = np.asarray(pva)
+            pva2d = pva.reshape(1, -1) if pva.ndim == 1 else pva
+            dn = np.empty(pva2d.shape) if out is None else out.reshape(pva2d.shape)
+            sn = np.empty(pva2d.shape) if compute_stderr else None
+            _kernels.simple_kernel(float(pvb), pva2d, float(spvb), float(spva), dn, sn)
+            return (dn.reshape(pva.shape) if out is None else out,
+                    sn.reshape(pva.shape) if compute_stderr else None)
+        if full_image and HAVE_NUMEXPR:
+            return _simple_numexpr(np.asarray(pva), float(pvb), float(spvb), float(spva), out=out,
+                                   compute_stderr=compute_stderr)
+
+        return _simple_numpy(pvb, pva, spvb, spva, out=out, compute_stderr=compute_stderr)
 
     @staticmethod
-    def calc(pvb, pva, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk):
+    def calc(pvb, pva, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk, out=None, sout=None, compute_stderr=True):
         """
         Full calculation of NetOD with background and control correction.
 
@@ -100,31 +134,47 @@ class NetOD:
             spvcb (float): Standard error of pvcb (scalar).
             spvca (float): Standard error of pvca (scalar).
             spvbk (float): Standard error of pvbk (scalar).
+            out (np.ndarray, optional): Float64 (or float32) array of the shape of the result, receiving the NetOD.
+                                        Allows a buffer to be reused when many images are processed.
+            sout (np.ndarray, optional): Float64 array of the shape of the result, receiving the standard error.
+            compute_stderr (bool, optional): If False, the standard error is not calculated. Defaults to True.
 
         Returns:
             tuple: NetOD and its standard error. If `pva` is a 2D array, NetOD is returned as a 2D array.
+                   If given, `out` and `sout` are returned. The standard error is None if `compute_stderr` is False.
+
+        Raises:
+            ValueError: If `out` or `sout` for a full image is not a C-contiguous float array of the shape of pva.
 
         Background-subtracted pixel values are calculated for both the irradiated region (`pvb`, `pva`)
         and the control region (`pvcb`, `pvca`). Error propagation is performed to account for uncertainties
         in all pixel values.
         """
-        # Background-subtracted pixel values
-        pvb_bk = pvb - pvbk
-        pva_bk = pva - pvbk
-        pvcb_bk = pvcb - pvbk
-        pvca_bk = pvca - pvbk
-
-        # NetOD calculation
-        dn = np.log10(pvb_bk / pva_bk) - np.log10(pvcb_bk / pvca_bk)
-
-        # Error propagation
-        l1 = (spvb / pvb_bk) ** 2 + (spva / pva_bk) ** 2
-        l3 = (spvcb / pvcb_bk) ** 2 + (spvca / pvca_bk) ** 2
-        l2 = ((pvb - pva) ** 2) / (pvb_bk * pva_bk) ** 2 * spvbk ** 2
-        l4 = ((pvcb - pvca) ** 2) / (pvcb_bk * pvca_bk) ** 2 * spvbk ** 2
+        scalars = (pvb, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk)
+        full_image = np.size(pva) >= _kernels.MIN_SIZE and all(np.ndim(v) == 0 for v in scalars)
+        if full_image and out is not None:
+            _kernels.check_out(out, np.shape(pva))
+        if full_image and sout is not None and compute_stderr:
+            _kernels.check_out(sout, np.shape(pva), "sout")
+        if full_image and _kernels.HAVE_NUMBA and np.ndim(pva) in (1, 2):
+            # Full image: compute NetOD and its error in one pass, without full-size temporaries
+            pva = np.asarray(pva)
+            pva2d = pva.reshape(1, -1) if pva.ndim == 1 else pva
+            dn = np.empty(pva2d.shape) if out is None else out.reshape(pva2d.shape)
+            if not compute_stderr:
+                sn = None
+            else:
+                sn = np.empty(pva2d.shape) if sout is None else sout.reshape(pva2d.shape)
+            _kernels.calc_kernel(pva2d, *map(float, scalars), dn, sn)
+            if sn is not None:
+                sn = sn.reshape(pva.shape) if sout is None else sout
+            return dn.reshape(pva.shape) if out is None else out, sn
+        if full_image and HAVE_NUMEXPR:
+            return _calc_numexpr(np.asarray(pva), *map(float, scalars), out=out, sout=sout,
+                                 compute_stderr=compute_stderr)
 
-        sn = (1.0 / np.log(10.0)) * np.sqrt(l1 + l2 + l3 + l4)
-        return dn, sn
+        return _calc_numpy(pvb, pva, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk, out=out, sout=sout,
+                           compute_stderr=compute_stderr)
 
     def dnetOD(self):
         """
@@ -144,3 +194,192 @@ class NetOD:
                 "Using full NetOD calculation with background and control correction.")
             return self.calc(self.pvb, self.pva, self.pvcb, self.pvca, self.pvbk,
                              self.spvb, self.spva, self.spvcb, self.spvca, self.spvbk)
+
+
+def _simple_numpy(pvb, pva, spvb=0, spva=0, out=None, compute_stderr=True):
+    """
+    NetOD.simple evaluated with NumPy, for any shapes of the arguments.
+
+    The arguments and return values are those of NetOD.simple. Unlike NetOD.simple, this never dispatches to
+    Numba or numexpr, so it can be called from several threads at once (e.g. on strips of an image).
+    Float32 arrays (such as the stored images of NetOD objects) are upcast for the arithmetic, and only the
+    results are float32 again.
+    """
+    dtype = np.result_type(pvb, pva, spvb, spva, 1.0)
+    pva, spva = _as_float64(pva), _as_float64(spva)
+    dn = np.log(pvb / pva, out=out)
+    dn *= _INV_LN10
+    if not compute_stderr:
+        return _as_result(dn, dtype, out), None
+    sn = _INV_LN10 * np.sqrt((spvb / pvb) ** 2 + (spva / pva) ** 2)
+    return _as_result(dn, dtype, out), _as_result(sn, dtype)
+
+
+def _calc_numpy(pvb, pva, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk, out=None, sout=None,
+                compute_stderr=True):
+    """
+    NetOD.calc evaluated with NumPy, for any shapes of the arguments.
+
+    The arguments and return values are those of NetOD.calc. Unlike NetOD.calc, this never dispatches to
+    Numba or numexpr, so it can be called from several threads at once (e.g. on strips of an image).
+    Float32 arrays are upcast for the arithmetic, see _simple_numpy().
+    """
+    dtype = np.result_type(pvb, pva, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk, 1.0)
+    pva, spva = _as_float64(pva), _as_float64(spva)
+    # Background-subtracted pixel values (no full-image subtraction if there is no background)
+    if np.ndim(pvbk) == 0 and pvbk == 0:
+        pvb_bk, pva_bk, pvcb_bk, pvca_bk = pvb, pva, pvcb, pvca
+    else:
+        pvb_bk = pvb - pvbk
+        pva_bk = pva - pvbk
+        pvcb_bk = pvcb - pvbk
+        pvca_bk = pvca - pvbk
+
+    # NetOD calculation: log10(pvb_bk / pva_bk) - log10(pvcb_bk / pvca_bk), with a single log per pixel,
+    # as the control ratio is folded into the (usually scalar) numerator
+    dn = np.log(pvb_bk * pvca_bk / pvcb_bk / pva_bk, out=out)
+    dn *= _INV_LN10
+    if not compute_stderr:
+        return _as_result(dn, dtype, out), None
+
+    # Error propagation (squares are written as products, which avoids the generic power dispatch)
+    rb, ra = spvb / pvb_bk, spva / pva_bk
+    rcb, rca = spvcb / pvcb_bk, spvca / pvca_bk
+    l1 = rb * rb + ra * ra
+    l3 = rcb * rcb + rca * rca
+    if np.ndim(spvbk) == 0 and spvbk == 0:
+        l2 = l4 = 0.0
+    else:
+        spvbk2 = spvbk * spvbk
+        d, p = pvb - pva, pvb_bk * pva_bk
+        l2 = d * d / (p * p) * spvbk2
+        dc, pc = pvcb - pvca, pvcb_bk * pvca_bk
+        l4 = dc * dc / (pc * pc) * spvbk2
+
+    sn = np.sqrt(l1 + l2 + l3 + l4, out=sout)
+    sn *= _INV_LN10
+    return _as_result(dn, dtype, out), _as_result(sn, dtype, sout)
+
+
+def _simple_numexpr(pva, pvb, spvb, spva, out=None, compute_stderr=True):
+    """
+    Simple NetOD calculation (see NetOD.simple) for an array pva and scalar other inputs, using numexpr.
+
+    numexpr evaluates the logarithm blockwise and multi-threaded, so the ratio pvb / pva is never stored
+    as a full-size temporary.
+
+    Args:
+        pva (np.ndarray): Pixel values after irradiation.
+        pvb (float): Pixel value before irradiation.
+        spvb, spva (float): Standard errors of the pixel values.
+        out (np.ndarray, optional): Float array receiving the NetOD.
+        compute_stderr (bool, optional): If False, the standard error is not calculated (returned as None).
+
+    Returns:
+        tuple: NetOD and its standard error, as arrays of the same shape as pva.
+    """
+    constants = {
+        "pva": pva,
+        "pvb": pvb,
+        "spva": spva,
+        "l1b": (spvb / pvb) ** 2,
+        "inv_ln10": _INV_LN10,
+    }
+    dn = numexpr.evaluate("log(pvb / pva) * inv_ln10", local_dict=constants, out=out, casting="same_kind")
+    if not compute_stderr:
+        return dn, None
+    sn = numexpr.evaluate("inv_ln10 * sqrt(l1b + (spva / pva) ** 2)", local_dict=constants)
+    return dn, sn
+
+
+def _calc_numexpr(pva, pvb, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk, out=None, sout=None,
+                  compute_stderr=True):
+    """
+    Full NetOD calculation (see NetOD.calc) for an array pva and scalar other inputs, using numexpr.
+
+    The scalar terms are computed once, and numexpr evaluates the per-pixel expressions blockwise
+    and multi-threaded, without full-size temporaries.
+
+    Args:
+        pva (np.ndarray): Pixel values after irradiation.
+        pvb, pvcb, pvca, pvbk (float): Pixel values before irradiation, of the control film and of the background.
+        spvb, spva, spvcb, spvca, spvbk (float): Standard errors of the pixel values.
+        out, sout (np.ndarray, optional): Float arrays receiving the NetOD and its standard error.
+        compute_stderr (bool, optional): If False, the standard error is not calculated (returned as None).
+
+    Returns:
+        tuple: NetOD and its standard error, as arrays of the same shape as pva.
+    """
+    pvb_bk = pvb - pvbk
+    pvcb_bk = pvcb - pvbk
+    pvca_bk = pvca - pvbk
+    constants = {
+        "pva": pva,
+        "pvb": pvb,
+        "pvbk": pvbk,
+        "pvb_bk": pvb_bk,
+        "spva": spva,
+        "spvbk2": spvbk ** 2,
+        "pvb_control": pvb_bk * pvca_bk / pvcb_bk,
+        "l1b": (spvb / pvb_bk) ** 2,
+        "l34": ((spvcb / pvcb_bk) ** 2 + (spvca / pvca_bk) ** 2
+                + ((pvcb - pvca) ** 2) / (pvcb_bk * pvca_bk) ** 2 * spvbk ** 2),
+        "inv_ln10": _INV_LN10,
+    }
+    dn = numexpr.evaluate("log(pvb_control / (pva - pvbk)) * inv_ln10", local_dict=constants, out=out,
+                          casting="same_kind")
+    if not compute_stderr:
+        return dn, None
+    sn = numexpr.evaluate("inv_ln10 * sqrt(l1b + (spva / (pva - pvbk)) ** 2"
+                          " + (pvb - pva) ** 2 / (pvb_bk * (pva - pvbk)) ** 2 * spvbk2 + l34)", local_dict=constants,
+                          out=sout, casting="same_kind")
+    return dn, sn
+
+
+def _as_value(value):
+    """
+    Wraps a value by np.asarray, unless it is a plain Python (or NumPy scalar) number.
+
+    Args:
+        value (float or array_like): Scalar or array of pixel values.
+
+    Returns:
+        float or np.ndarray: The number itself, or the value as a NumPy array.
+    """
+    return value if isinstance(value, (int, float, np.number)) else np.asarray(value)
+
+
+def _as_float32_image(value):
+    """
+    Converts arrays to float32, while Python numbers are kept and other scalars are wrapped by np.asarray.
+
+    Args:
+        value (float or np.ndarray): Scalar or array of pixel values.
+
+    Returns:
+        float or np.ndarray: The number itself, or the value as a NumPy array, float32 if it has at least one dimension.
+    """
+    value = _as_value(value)
+    if isinstance(value, (int, float)):
+        return value
+    return value.astype(np.float32, copy=False) if value.ndim >= 1 else value
+
+
+def _as_float64(value):
+    """
+    Converts float32 arrays to float64, for arithmetic which loses digits in float32 (e.g. the log of
+    ratios close to 1). Other values are returned as they are.
+    """
+    if isinstance(value, np.ndarray) and value.dtype == np.float32:
+        return value.astype(np.float64)
+    return value
+
+
+def _as_result(value, dtype, out=None):
+    """
+    Casts a result computed in float64 back to the dtype of the inputs (float32 for float32 images),
+    unless it was written into a given output array.
+    """
+    if out is not None:
+        return out
+    return value.astype(dtype, copy=False)
@@ -1,5 +1,9 @@
+import os
 import roifile
 import logging
+from functools import lru_cache
+
+import numpy as np
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -13,6 +17,9 @@ class ROI:
     Attributes:
         fn (str): The path to the ROI file.
         rois (list): A list of tuples representing each ROI as (left, right, top, bottom).
+        rois_arr (np.ndarray): The same ROIs as a read-only (N, 4) int32 array, one row per ROI.
+        slices (list): The same ROIs as (rows, columns) tuples of slices, so that `image[roi.slices[i]]`
+                       is the i-th ROI of a (height, width) or (height, width, channels) image.
 
     Methods:
         load_rois(fn):
@@ -22,12 +29,15 @@ class ROI:
     def __init__(self, fn):
         """
         Initializes the ROI class by loading ROIs from the specified file.
+        Files are parsed only once per process, later ROI objects for the same, unchanged file reuse the result.
 
         Args:
             fn (str): The path to the ROI file.
         """
         self.fn = fn
-        self.rois = self.load_rois(fn)
+        self.rois_arr = _load_rois(fn)
+        self.rois = [tuple(roi) for roi in self.rois_arr.tolist()]
+        self.slices = [np.s_[top:bottom, left:right] for left, right, top, bottom in self.rois]
 
     @staticmethod
     def load_rois(fn):
@@ -46,20 +56,51 @@ class ROI:
         Returns:
             list: A list of (left, right, top, bottom) tuples representing each ROI.
         """
-        logger.debug(f"Loading ROIs from file: {fn}")
+        return [tuple(roi) for roi in _load_rois(fn).tolist()]
+
+
+def _load_rois(fn):
+    """
+    Reads an ImageJ ROI file, see ROI.load_rois(), reusing the result as long as the file is unchanged on disk.
+
+    Args:
+        fn (str): The path to the ROI file (can be a .roi or .zip file).
+
+    Returns:
+        np.ndarray: A read-only (N, 4) int32 array of (left, right, top, bottom) rows (shared between calls).
+    """
+    return _load_rois_cached(os.path.abspath(fn), os.path.getmtime(fn))
+
+
+@lru_cache(maxsize=64)
+def _load_rois_cached(fn, mtime):
+    """
+    Reads an ImageJ ROI file, see ROI.load_rois(). The result is cached by filename and modification time,
+    so changed files are read again.
+
+    Args:
+        fn (str): The absolute path to the ROI file (can be a .roi or .zip file).
+        mtime (float): Modification time of the file, only used as part of the cache key.
+
+    Returns:
+        np.ndarray: A read-only (N, 4) int32 array of (left, right, top, bottom) rows.
+    """
+    logger.debug(f"Loading ROIs from file: {fn}")
 
-        roi_objs = roifile.roiread(fn)
+    roi_objs = roifile.roiread(fn)
 
-        # Ensure the result is iterable, even if a single ROI is loaded.
-        if not isinstance(roi_objs, list):
-            roi_objs = [roi_objs]
+    # Ensure the result is iterable, even if a single ROI is loaded.
+    if not isinstance(roi_objs, list):
+        roi_objs = [roi_objs]
 
-        rois = [(r.left, r.right, r.top, r.bottom) for r in roi_objs]
+    rois = np.array([(r.left, r.right, r.top, r.bottom) for r in roi_objs], dtype=np.int32).reshape(-1, 4)
+    # The array is shared by all callers through the cache
+    rois.flags.writeable = False
 
-        # Log the loaded ROIs for debugging purposes
-        logger.debug(f"Loaded {len(rois)} ROIs from {fn}")
-        for i, roi in enumerate(rois):
-            logger.debug(
-                f"ROI {i+1}: Left={roi[0]}, Right={roi[1]}, Top={roi[2]}, Bottom={roi[3]}")
+    # Log the loaded ROIs for debugging purposes
+    logger.debug(f"Loaded {len(rois)} ROIs from {fn}")
+    for i, roi in enumerate(rois):
+        logger.debug(
+            f"ROI {i+1}: Left={roi[0]}, Right={roi[1]}, Top={roi[2]}, Bottom={roi[3]}")
 
-        return rois
+    return rois
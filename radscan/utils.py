@@ -7,3 +7,23 @@ CHANNEL_MAP = {
     2: 'BLUE',
     5: 'Three, sir.'
 }
+
+# matplotlib.pyplot, once imported by get_pyplot()
+_pyplot = None
+
+
+def get_pyplot():
+    """
+    Returns the matplotlib.pyplot module, importing it on first use.
+
+    matplotlib is an optional dependency (`pip install radscan[plotting]`) and slow to import,
+    so it is only loaded by the plotting methods and never by `import radscan`.
+
+    Returns:
+        module: matplotlib.pyplot
+    """
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib.pyplot as plt
+        _pyplot = plt
+    return _pyplot
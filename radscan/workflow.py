@@ -1,10 +1,172 @@
+import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 
-from radscan import Calibration, NetOD
+import numpy as np
+
+from radscan import Calibration, NetOD, RSImage
+from radscan import _kernels
+from radscan.calibration import _integer_exponent
+from radscan.netod import _calc_numpy, _simple_numpy
 
 
 logger = logging.getLogger(__name__)
 
+# Number of pixels per tile for full-image NetOD, so the intermediates of a tile stay in the L2 cache
+_TILE_PIXELS = 256 * 256
+
+
+def _load_calibration(calibration_file):
+    """
+    Loads a calibration file, reusing the loaded Calibration object as long as the file is unchanged on disk.
+
+    Args:
+        calibration_file (str): Full path to the calibration file.
+
+    Returns:
+        Calibration: The calibration object (shared between calls, do not modify).
+    """
+    return _load_calibration_cached(os.path.abspath(calibration_file), os.path.getmtime(calibration_file))
+
+
+@lru_cache(maxsize=8)
+def _load_calibration_cached(calibration_file, mtime):
+    """
+    Cached Calibration.load(). The modification time is only part of the cache key, so changed files are reloaded.
+    """
+    return Calibration.load(calibration_file)
+
+
+def _run_concurrently(*calls, kernels=None):
+    """
+    Runs independent calls, such as the ROI analysis of several images, on a thread pool.
+
+    NumPy releases the GIL in its reductions, so the calls overlap. With Numba, calls which may dispatch to a Numba
+    kernel are run one after the other in the calling thread instead, as the kernels are parallel already (and not
+    all Numba threading layers are thread-safe); the other calls still run on the thread pool meanwhile.
+
+    Args:
+        *calls (callable): Functions without arguments.
+        kernels (sequence of bool, optional): For each call, whether it may dispatch to a Numba kernel
+                                              (e.g. RSImage.analyze), or only runs NumPy code (e.g. RSImage.roi_means).
+                                              Defaults to True for all calls.
+
+    Returns:
+        list: The return values of the calls, in the same order.
+    """
+    serial = [_kernels.HAVE_NUMBA and kernel for kernel in (kernels if kernels is not None else [True] * len(calls))]
+    if len(calls) < 2 or all(serial):
+        return [call() for call in calls]
+    with ThreadPoolExecutor(max_workers=serial.count(False)) as executor:
+        futures = [None if in_thread else executor.submit(call) for call, in_thread in zip(calls, serial)]
+        results = [call() if in_thread else None for call, in_thread in zip(calls, serial)]
+        return [result if future is None else future.result() for result, future in zip(results, futures)]
+
+
+def _analyze_single(*images, channel=0):
+    """
+    Runs RSImage.analyze(single=True) on several images concurrently (see _run_concurrently).
+
+    Images passed more than once, such as a pre-irradiation image also used as control image,
+    are analyzed only once.
+
+    Args:
+        *images (RSImage): Images with ROIs attached.
+        channel (int): The color channel to analyze.
+
+    Returns:
+        list: The tuples (mean, stderr, minval, maxval) of the images, in the same order.
+    """
+    unique = list({id(image): image for image in images}.values())
+    results = _run_concurrently(*(partial(image.analyze, channel=channel, single=True) for image in unique))
+    by_id = {id(image): result for image, result in zip(unique, results)}
+    return [by_id[id(image)] for image in images]
+
+
+def _background_stats(background, channel=0):
+    """
+    Returns the mean pixel value of the background and its standard error.
+
+    Args:
+        background (RSImage, tuple, float or None): Background image with ROIs attached, its statistics as
+            returned by RSImage.analyze(single=True), a plain pixel value, or None if there is no background.
+        channel (int): The color channel to analyze, if background is an RSImage.
+
+    Returns:
+        tuple: (mean, stderr) of the background pixel value, (0, 0) if there is no background.
+    """
+    if background is None:
+        return 0, 0
+    if isinstance(background, RSImage):
+        background = background.analyze(channel=channel, single=True)
+    if np.ndim(background) == 0:
+        return background, 0
+    return background[0], background[1]
+
+
+def _image_map(netod_func, pvb, pva, *args, calibration=None, out=None):
+    """
+    Computes the NetOD map of a 2D image pva, or its dose map if a calibration is given.
+
+    The map is stored as float32 (unless a float64 `out` is given), while the arithmetic is done in float64:
+    this halves the memory traffic of these memory-bound passes, and float32 precision is far below the
+    uncertainty of film dosimetry.
+
+    With Numba, NetOD and dose are computed together in a single parallel pass over the image. Otherwise the image
+    is processed in strips of rows on a thread pool, with NetOD and dose calculated strip by strip, so that the
+    intermediates of a strip stay in cache instead of streaming full-image temporaries through main memory.
+    NumPy releases the GIL in the element-wise operations. The strips are always evaluated with NumPy, not numexpr.
+
+    Args:
+        netod_func (callable): NetOD.simple or NetOD.calc.
+        pvb (float): Pixel value before irradiation (scalar).
+        pva (np.ndarray): 2D array of pixel values after irradiation.
+        *args: The remaining (scalar) arguments of netod_func.
+        calibration (Calibration, optional): Calibration to convert NetOD to dose.
+        out (np.ndarray, optional): Float32 or float64 array of the shape of pva, receiving the result.
+
+    Returns:
+        np.ndarray: NetOD (or dose) map of the same shape as pva (`out`, if given).
+
+    Raises:
+        ValueError: If `out` is not a C-contiguous float array of the shape of pva.
+    """
+    pvb, args = float(pvb), [float(arg) for arg in args]
+    if out is None:
+        out = np.empty(pva.shape, dtype=np.float32)
+    else:
+        _kernels.check_out(out, pva.shape)
+
+    if _kernels.HAVE_NUMBA:
+        if calibration is None or pva.ndim != 2:
+            netod, _ = netod_func(pvb, pva, *args, out=out, compute_stderr=False)
+            return calibration.dose(netod, out=out) if calibration else netod
+        # Fused NetOD and dose kernels: each pixel is read once and its dose written once
+        a, b, c = calibration.fitparams.tolist()
+        if netod_func is NetOD.simple:
+            _kernels.simple_dose_kernel(pvb, pva, a, b, c, _integer_exponent(c), out)
+        else:
+            pvcb, pvca, pvbk = args[:3]
+            _kernels.calc_dose_kernel(pva, pvb, pvcb, pvca, pvbk, a, b, c, _integer_exponent(c), out)
+        return out
+
+    # The NumPy implementation on all strips: numexpr is multi-threaded itself, so calling it from the strip threads
+    # would nest thread pools (and older numexpr releases are not thread-safe)
+    numpy_func = _simple_numpy if netod_func is NetOD.simple else _calc_numpy
+
+    def strip_map(strip):
+        # float64 math within the (cached) strip, as the log of ratios close to 1 loses digits in float32
+        netod, _ = numpy_func(pvb, pva[strip].astype(float, copy=False), *args, compute_stderr=False)
+        return calibration.dose(netod) if calibration else netod
+
+    rows = max(1, _TILE_PIXELS // max(1, pva.shape[1]))
+    strips = [slice(i, i + rows) for i in range(0, pva.shape[0], rows)]
+    with ThreadPoolExecutor() as executor:
+        for strip, values in zip(strips, executor.map(strip_map, strips)):
+            out[strip] = values
+    return out
+
 
 def analyze_simple_roi(pre_image, post_image, calibration_file=None, channel=0):
     """
@@ -14,6 +176,7 @@ def analyze_simple_roi(pre_image, post_image, calibration_file=None, channel=0):
         pre_image (RSImage): Pre-irradiation image with ROIs attached.
         post_image (RSImage): Post-irradiation image with corresponding ROIs attached.
         calibration_file (str, optional): Full path to the calibration file.
+        channel (int, optional): The color channel to analyze. Defaults to 0 (Red for color images).
 
     Returns:
         list: A list of NetOD (or dose) values, one for each ROI.
@@ -36,25 +199,22 @@ def analyze_simple_roi(pre_image, post_image, calibration_file=None, channel=0):
         raise ValueError(
             "Mismatched ROI counts in pre- and post-irradiation images.")
 
-    pre_values = pre_image.analyze(channel=channel)
-    post_values = post_image.analyze(channel=channel)
-    # pre and post contains the mean, stderr, min, and max values for each ROI.
+    # Mean pixel values of each ROI; their standard errors are not needed, as only the NetOD itself is returned
+    pvb, pva = _run_concurrently(partial(pre_image.roi_means, channel=channel),
+                                 partial(post_image.roi_means, channel=channel), kernels=(False, False))
 
-    netod_values = []
-    for pre_value, post_value in zip(pre_values, post_values):
-        netod, _ = NetOD.simple(
-            pre_value[0], post_value[0], pre_value[1], post_value[1])
-        netod_values.append(netod)
+    # NetOD of all ROIs at once
+    netod_values, _ = NetOD.simple(pvb, pva, compute_stderr=False)
 
     # If calibration is provided, convert NetOD to dose
     if calibration_file:
-        calibration = Calibration.load(calibration_file)
-        return [calibration.dose(netod) for netod in netod_values]
+        calibration = _load_calibration(calibration_file)
+        return list(calibration.dose(netod_values))
     else:
-        return netod_values
+        return list(netod_values)
 
 
-def analyze_simple_image(pre_image, post_image, calibration_file=None, channel=0):
+def analyze_simple_image(pre_image, post_image, calibration_file=None, channel=0, out=None):
     """
     Analyze the entire post-irradiation image and return NetOD or dose (without background or control).
 
@@ -62,23 +222,22 @@ def analyze_simple_image(pre_image, post_image, calibration_file=None, channel=0
         pre_image (RSImage): Pre-irradiation image with one or more ROIs attached.
         post_image (RSImage): Post-irradiation image (without ROIs).
         calibration_file (str, optional): Full path to the calibration file.
+        channel (int, optional): The color channel to analyze. Defaults to 0 (Red for color images).
+        out (np.ndarray, optional): Float32 (or float64) array of the image shape receiving the NetOD (or dose) map,
+                                    so the buffer can be reused, or memory-mapped for very large scans.
 
     Returns:
-        np.ndarray: A 2D array of NetOD (or dose) values.
+        np.ndarray: A 2D float32 array of NetOD (or dose) values (`out`, if given).
     """
     # Analyze pre-irradiation image and average their results over all attached ROIs
-    pre_value = pre_image.analyze(single=True)
+    pre_value = pre_image.analyze(channel=channel, single=True)
     print(pre_value[0])
 
-    # Calculate 2D NetOD using the scalar from pre-image and 2D pixel values from post-image
-    netod, _ = NetOD.simple(pre_value[0], post_image.image[:, :, channel])
+    # Load calibration file if provided, to convert NetOD to dose
+    calibration = _load_calibration(calibration_file) if calibration_file else None
 
-    # Load calibration file if provided and convert NetOD to dose
-    if calibration_file:
-        calibration = Calibration.load(calibration_file)
-        return calibration.dose(netod)
-    else:
-        return netod
+    # Calculate 2D NetOD (or dose) using the scalar from pre-image and 2D pixel values from post-image
+    return _image_map(NetOD.simple, pre_value[0], post_image.channel(channel), calibration=calibration, out=out)
 
 
 def analyze_roi(pre_image, post_image,
@@ -93,8 +252,11 @@ def analyze_roi(pre_image, post_image,
         post_image (RSImage): Post-irradiation image with ROIs attached.
         control_pre_image (RSImage): Control pre-irradiation image with ROIs attached.
         control_post_image (RSImage): Control post-irradiation image with ROIs attached.
-        background_image (RSImage): Background image with ROIs attached.
+        background_image (RSImage, tuple or float): Background image with ROIs attached, or its statistics
+            precomputed by background_image.analyze(single=True), or a plain background pixel value.
+            None if there is no background.
         calibration_file (str, optional): Full path to the calibration file.
+        channel (int, optional): The color channel to analyze. Defaults to 0 (Red for color images).
 
     Returns:
         list: A list of NetOD, or dose, values, one for each ROI.
@@ -114,38 +276,30 @@ def analyze_roi(pre_image, post_image,
             "Number of ROIs must match between control pre and post-irradiation images.")
         return
 
-    # Analyze pre and post images for each ROI
-    pre_values = pre_image.analyze()
-    post_values = post_image.analyze()
-
-    # Analyze control and background images as scalars (single=True)
-    control_pre_value = control_pre_image.analyze(single=True)
-    control_post_value = control_post_image.analyze(single=True)
-    background_value = background_image.analyze(single=True)
-
-    netod_values = []
+    # Analyze pre and post images for each ROI, and control and background images as scalars (single=True),
+    # all images at once
+    # (only the mean pixel values of the pre and post ROIs, as the standard error of the NetOD is not returned)
+    pvb, pva, (control_pre_value, control_post_value), (background_value, spvbk) = _run_concurrently(
+        partial(pre_image.roi_means, channel=channel), partial(post_image.roi_means, channel=channel),
+        partial(_analyze_single, control_pre_image, control_post_image, channel=channel),
+        partial(_background_stats, background_image, channel), kernels=(False, False, True, True))
 
-    # Loop through each ROI in the pre and post images
-    for i, (pre_value, post_value) in enumerate(zip(pre_values, post_values)):
-        # Use NetOD.calc for full analysis with background and control
-        netod, _ = NetOD.calc(pre_value[0], post_value[0],
-                              control_pre_value[0], control_post_value[0],
-                              background_value[0] if background_value else 0,
-                              pre_value[1], post_value[1], control_pre_value[1], control_post_value[1],
-                              background_value[1] if background_value else 0)
-        netod_values.append(netod)
+    # Use NetOD.calc for full analysis with background and control, for all ROIs at once
+    netod_values, _ = NetOD.calc(pvb, pva,
+                                 control_pre_value[0], control_post_value[0], background_value,
+                                 0, 0, control_pre_value[1], control_post_value[1], spvbk, compute_stderr=False)
 
     # If calibration is provided, convert NetOD to dose
     if calibration_file:
-        calibration = Calibration.load(calibration_file)
-        return [calibration.dose(netod) for netod in netod_values]
+        calibration = _load_calibration(calibration_file)
+        return list(calibration.dose(netod_values))
     else:
-        return netod_values
+        return list(netod_values)
 
 
 def analyze_image(pre_image, post_image,
                   control_pre_image, control_post_image, background_image,
-                  calibration_file=None, channel=0):
+                  calibration_file=None, channel=0, out=None):
     """
     Analyze the entire post-irradiation image along with control and background,
     convert pixel values to NetOD or dose, and return a 2D array of results.
@@ -155,37 +309,39 @@ def analyze_image(pre_image, post_image,
         post_image (RSImage): Post-irradiation image (full image, without ROIs).
         control_pre_image (RSImage): Control pre-irradiation image with ROIs attached.
         control_post_image (RSImage): Control post-irradiation image with ROIs attached.
-        background_image (RSImage): Background image with ROIs attached.
+        background_image (RSImage, tuple or float): Background image with ROIs attached, or its statistics
+            precomputed by background_image.analyze(single=True), or a plain background pixel value.
+            None if there is no background.
         calibration_file (str, optional): Full path to the calibration file.
+        channel (int, optional): The color channel to analyze. Defaults to 0 (Red for color images).
+        out (np.ndarray, optional): Float32 (or float64) array of the image shape receiving the NetOD (or dose) map,
+                                    so the buffer can be reused when many images are analyzed, or memory-mapped for
+                                    very large scans.
 
     Returns:
-        np.ndarray: A 2D array of NetOD (or dose) values.
+        np.ndarray: A 2D float32 array of NetOD (or dose) values (`out`, if given).
     """
 
     # Analyze pre-image and control images, using the average of ROIs as a single scalar
-    pre_value, spvb = pre_image.analyze(single=True)[0:2]
-    control_pre_value, spvcb = control_pre_image.analyze(single=True)[0:2]
-    control_post_value, spvca = control_post_image.analyze(single=True)[0:2]
+    # (the control images may be the pre-image itself, which is then analyzed only once)
+    pre_stats, control_pre_stats, control_post_stats = _analyze_single(pre_image, control_pre_image,
+                                                                       control_post_image, channel=channel)
+    pre_value, spvb = pre_stats[0:2]
+    control_pre_value, spvcb = control_pre_stats[0:2]
+    control_post_value, spvca = control_post_stats[0:2]
 
     # Analyze background image as a scalar (if provided)
-    if background_image:
-        background_value, spvbk = background_image.analyze(single=True)[0:2]
-    else:
-        background_value = 0
-        spvbk = 0
+    background_value, spvbk = _background_stats(background_image, channel)
 
     # Analyze the full post-irradiation image (2D array)
     # Placeholder for post_image stderr
-    post_image_values, spva = post_image.image[:, :, channel], 0
+    post_image_values, spva = post_image.channel(channel), 0
 
-    # Calculate 2D NetOD using the scalars from pre, control, and background images and the 2D post-irradiation values
-    netod, _ = NetOD.calc(pre_value, post_image_values,
-                          control_pre_value, control_post_value,
-                          background_value, spvb, spva, spvcb, spvca, spvbk)
+    # Load calibration file if provided, to convert NetOD to dose
+    calibration = _load_calibration(calibration_file) if calibration_file else None
 
-    # Load calibration file if provided and convert NetOD to dose
-    if calibration_file:
-        calibration = Calibration.load(calibration_file)
-        return calibration.dose(netod)
-    else:
-        return netod
+    # Calculate 2D NetOD (or dose) using the scalars from pre, control, and background images
+    # and the 2D post-irradiation values
+    return _image_map(NetOD.calc, pre_value, post_image_values,
+                      control_pre_value, control_post_value, background_value, spvb, spva, spvcb, spvca, spvbk,
+                      calibration=calibration, out=out)
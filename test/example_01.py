@@ -1,13 +1,15 @@
 import os
 import logging
+import tempfile
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+import numpy as np
 
 from radscan import RSImage, ROI
 # from radscan import Calibration # only needed if we want to plot the calibration curve
 from radscan.workflow import analyze_simple_image, analyze_simple_roi
 
+from example_plots import plot_image_results
+
 logger = logging.getLogger(__name__)
 
 
@@ -52,9 +54,9 @@ def main(args=None):
     # The length of the ROI list must be the same in both pre and post images.
     roi_post_filename = "RoiSet_post1.zip"
 
-    # Next, set the calibration file, which is a pickle file containing a calibration dataset
+    # Next, set the calibration file, which is a NumPy .npz archive containing a calibration dataset
     # It is also possible to use the Calibration class to make a new set, but for this example it is already done.
-    calibration_file = "./resources/ebt_calibration_lot03172103_RED_simple.pkl"
+    calibration_file = "./resources/ebt_calibration_lot03172103_RED_simple.npz"
     channel = 0  # 0=RED channel, 1=GREEN, 2=BLUE
 
     # If you want to plot the calibration curve, you can do so with the following line:
@@ -88,71 +90,18 @@ def main(args=None):
 
     # But alternatively, we can also do a full 2D-image analysis,
     # which means, the full post_image is converted from pixel_values to dose, using the calibration curve:
+    # The dose map of a high resolution scan can take several GB, so large maps are written to a
+    # memory-mapped temporary file instead of being held in memory:
+    height, width = post_image.image.shape[:2]
+    dose_map = None
+    if height * width * 4 > 512 << 20:
+        dose_map = np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=(height, width))
     results_by_image_dose = analyze_simple_image(pre_image, post_image,
-                                                 calibration_file, channel)
+                                                 calibration_file, channel, out=dose_map)
 
     # Plot the full-image dose map
-    plot_results(results_by_image_dose, dpi=300,
-                 pixel_size=0.1, rois=roi_post.rois, vmax=22.0)
-
-
-def plot_results(results, dpi, pixel_size, plot_type="image", save=None, rois=None, vmax=None):
-    """
-    Function to plot results of the analysis.
-
-    Args:
-        results (np.ndarray or list): The results to plot. Can be either a 2D array for full-image analysis
-                                      or a list of values for ROI-based analysis.
-        dpi (float): The dots per inch (DPI) resolution of the scan.
-        pixel_size (float): The size of each pixel in millimeters.
-        plot_type (str): Either "image" for 2D analysis or "roi" for ROI-based analysis.
-        save (str, optional): If provided, the plot will be saved to the given filename instead of being displayed.
-    """
-
-    # TODO: Convert pixel indices to mm using the pixel size
-    # height_in_mm = results.shape[0] * pixel_size
-    # width_in_mm = results.shape[1] * pixel_size
-
-    if not vmax:
-        vmax = results.max()  # TODO: eliminate NaN values from results array
-
-    if plot_type == "image":
-        # Plot the full 2D dose map with proper vmin and vmax
-        plt.imshow(results, vmin=0, vmax=vmax, cmap="gist_ncar")
-        cb = plt.colorbar()
-        cb.set_label("Dose [Gy]")
-
-        plt.xlabel("X axis [pixels]")
-        plt.ylabel("Y axis [pixels]")
-        # TODO: set axis scales to mm instead of pixels
-        plt.title("Dose Distribution")
-        plt.gca().set_aspect('auto')
-        # Plot ROI rectangles
-        if rois:
-            for idx, (xmin, xmax, ymin, ymax) in enumerate(rois):
-                rect = patches.Rectangle((xmin, ymin), xmax - xmin, ymax - ymin,
-                                         linewidth=2, edgecolor='r', facecolor='none')
-                plt.gca().add_patch(rect)
-                # Add ROI index to the center of the rectangle
-                plt.text((xmin + xmax) / 2, (ymin + ymax) / 2, f"ROI {idx+1}",
-                         color='red', ha='center', va='center', fontsize=8, fontweight='bold')
-
-    elif plot_type == "roi":
-        # Plot ROI-based dose results as a bar chart
-        plt.bar(range(len(results)), results)
-        plt.xlabel("ROI Index")
-        plt.ylabel("Dose [Gy]")
-        plt.title("Dose per ROI")
-    else:
-        logger.error(f"Unknown plot_type: {plot_type}")
-        return
-
-    # Save plot to file if filename is provided, else display it
-    if save:
-        plt.savefig(save, dpi=dpi, bbox_inches='tight')
-        logger.info(f"Plot saved as {save}")
-    else:
-        plt.show()
+    plot_image_results(results_by_image_dose, dpi=300,
+                       pixel_size=0.1, rois=roi_post.rois, vmax=22.0)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,15 @@
 import os
-import copy
 import logging
+import tempfile
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+import numpy as np
 
 from radscan import RSImage, ROI
 # from radscan import Calibration # only needed if we want to plot the calibration curve
 from radscan.workflow import analyze_image, analyze_roi
 
+from example_plots import plot_image_results
+
 logger = logging.getLogger(__name__)
 
 
@@ -69,9 +70,9 @@ def main(args=None):
     # Control films before and after irradiation are included in the pre_ and post_filenames.
     # So we are not loading any more films by now.
 
-    # Next, set the calibration file, which is a pickle file containing a calibration dataset
+    # Next, set the calibration file, which is a NumPy .npz archive containing a calibration dataset
     # It is also possible to use the Calibration class to make a new set, but for this example it is already done.
-    calibration_file = "./resources/ebt_calibration_lot03172103_RED.pkl"
+    calibration_file = "./resources/ebt_calibration_lot03172103_RED.npz"
     channel = 0  # 0=RED channel, 1=GREEN, 2=BLUE
 
     # If you want to plot the calibration curve, you can do so with the following line:
@@ -98,11 +99,9 @@ def main(args=None):
     # The control images are taken before and after the irradiation.
 
     # in this case, the pre and post data is stored in the same file, but in a single ROI.
-    control_pre_image = copy.deepcopy(pre_image)
-    control_post_image = copy.deepcopy(post_image)
-    # the last ROI is the control ROI:
-    control_pre_image.rois = [pre_image.rois[-1]]
-    control_post_image.rois = [post_image.rois[-1]]
+    # the last ROI is the control ROI; the control images share the pixel data with the pre and post images:
+    control_pre_image = pre_image.with_rois([pre_image.rois[-1]])
+    control_post_image = post_image.with_rois([post_image.rois[-1]])
 
     # If the control film was not made, then pre-scanned films can be used for both parts.
     # In this case, the pre_image is used for both control images.
@@ -117,10 +116,15 @@ def main(args=None):
     roi_back = ROI(os.path.join(data_dir, roi_background_filename))
     background_image.rois = roi_back.rois
 
+    # Only the mean pixel value of the background ROIs (and its standard error) is needed, so it is computed once
+    # here for both analyses below, and the averaged background scans can be released:
+    background = background_image.analyze(channel=channel, single=True)
+    del background_image
+
     # Now we have all input data available, so we can proceed with the analysis.
     # First we do a simple analysis by ROI, which means, each ROI an average dose is calculated:
     results_by_roi = analyze_roi(pre_image, post_image, control_pre_image,
-                                 control_post_image, background_image,
+                                 control_post_image, background,
                                  calibration_file, channel)
     # check against nominal doses:
     dose_nominal = [12, 20, 2, 8, 2, 20, 4, 12, 4, 0]
@@ -129,73 +133,20 @@ def main(args=None):
 
     # But alternatively, we can also do a full image analysis,
     # which means, the full post_image is converted from pixel_values to dose, using the calibration curve:
+    # The dose map of a high resolution scan can take several GB, so large maps are written to a
+    # memory-mapped temporary file instead of being held in memory:
+    height, width = post_image.image.shape[:2]
+    dose_map = None
+    if height * width * 4 > 512 << 20:
+        dose_map = np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=(height, width))
     results_by_image_dose = analyze_image(pre_image, post_image,
                                           control_pre_image,
-                                          control_post_image, background_image,
-                                          calibration_file, channel)
+                                          control_post_image, background,
+                                          calibration_file, channel, out=dose_map)
 
     # Plot the full-image dose map
-    plot_results(results_by_image_dose, dpi=300,
-                 pixel_size=0.1, rois=roi_post.rois, vmax=22.0)
-
-
-def plot_results(results, dpi, pixel_size, plot_type="image", save=None, rois=None, vmax=None):
-    """
-    Function to plot results of the analysis.
-
-    Args:
-        results (np.ndarray or list): The results to plot. Can be either a 2D array for full-image analysis
-                                      or a list of values for ROI-based analysis.
-        dpi (float): The dots per inch (DPI) resolution of the scan.
-        pixel_size (float): The size of each pixel in millimeters.
-        plot_type (str): Either "image" for 2D analysis or "roi" for ROI-based analysis.
-        save (str, optional): If provided, the plot will be saved to the given filename instead of being displayed.
-    """
-
-    # TODO: Convert pixel indices to mm using the pixel size
-    # height_in_mm = results.shape[0] * pixel_size
-    # width_in_mm = results.shape[1] * pixel_size
-
-    if not vmax:
-        vmax = results.max()  # TODO: eliminate NaN values from results array
-
-    if plot_type == "image":
-        # Plot the full 2D dose map with proper vmin and vmax
-        plt.imshow(results, vmin=0, vmax=vmax, cmap="gist_ncar")
-        cb = plt.colorbar()
-        cb.set_label("Dose [Gy]")
-
-        plt.xlabel("X axis [pixels]")
-        plt.ylabel("Y axis [pixels]")
-        # TODO: set axis scales to mm instead of pixels
-        plt.title("Dose Distribution")
-        plt.gca().set_aspect('auto')
-        # Plot ROI rectangles
-        if rois:
-            for idx, (xmin, xmax, ymin, ymax) in enumerate(rois):
-                rect = patches.Rectangle((xmin, ymin), xmax - xmin, ymax - ymin,
-                                         linewidth=2, edgecolor='r', facecolor='none')
-                plt.gca().add_patch(rect)
-                # Add ROI index to the center of the rectangle
-                plt.text((xmin + xmax) / 2, (ymin + ymax) / 2, f"ROI {idx+1}",
-                         color='red', ha='center', va='center', fontsize=8, fontweight='bold')
-
-    elif plot_type == "roi":
-        # Plot ROI-based dose results as a bar chart
-        plt.bar(range(len(results)), results)
-        plt.xlabel("ROI Index")
-        plt.ylabel("Dose [Gy]")
-        plt.title("Dose per ROI")
-    else:
-        logger.error(f"Unknown plot_type: {plot_type}")
-        return
-
-    # Save plot to file if filename is provided, else display it
-    if save:
-        plt.savefig(save, dpi=dpi, bbox_inches='tight')
-        logger.info(f"Plot saved as {save}")
-    else:
-        plt.show()
+    plot_image_results(results_by_image_dose, dpi=300,
+                       pixel_size=0.1, rois=roi_post.rois, vmax=22.0)
 
 
 if __name__ == "__main__":
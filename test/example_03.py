@@ -2,13 +2,13 @@ import os
 import logging
 
 import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 
 from radscan import RSImage, ROI
 from radscan import CHANNEL_MAP
 from radscan import Calibration
 from radscan.workflow import analyze_simple_image, analyze_simple_roi
 
+from example_plots import plot_image_results
 
 logger = logging.getLogger(__name__)
 
@@ -77,56 +77,30 @@ def main(args=None):
     channel = 2  # 0=RED channel, 1=GREEN, 2=BLUE
 
     # Next we need to calculate NetOD values from the images.
-
-    # Load images
-    pre_image_set1 = RSImage([os.path.join(data_dir, fn)
-                             for fn in pre_filenames_set1])
-    post_image_set1 = RSImage([os.path.join(data_dir, fn)
-                              for fn in post_filenames_set1])
-    pre_image_set2 = RSImage([os.path.join(data_dir, fn)
-                             for fn in pre_filenames_set2])
-    post_image_set2 = RSImage([os.path.join(data_dir, fn)
-                              for fn in post_filenames_set2])
-
-    # Load ROIs
-    roi_pre_set1 = ROI(os.path.join(data_dir, roi_pre_filename_set1))
-    roi_post_set1 = ROI(os.path.join(data_dir, roi_post_filename_set1))
-    roi_pre_set2 = ROI(os.path.join(data_dir, roi_pre_filename_set2))
-    roi_post_set2 = ROI(os.path.join(data_dir, roi_post_filename_set2))
-
-    # and attach the ROI tuple lists to the images:
-    pre_image_set1.rois = roi_pre_set1.rois
-    post_image_set1.rois = roi_post_set1.rois
-    pre_image_set2.rois = roi_pre_set2.rois
-    post_image_set2.rois = roi_post_set2.rois
-
-    # Now we have all input data available, so we can proceed with the analysis.
-    # First we do a simple analysis by ROI, which means, each ROI an average netOD is calculated.
+    # Each set is loaded and analyzed on its own, so only the averaged scans of one set are held in memory at a time.
     # Note, since we do not provide a calibration file, the results will be in netOD units.
-    results_by_roi_set1 = analyze_simple_roi(
-        pre_image_set1, post_image_set1, channel=channel)
-
-    results_by_roi_set2 = analyze_simple_roi(
-        pre_image_set2, post_image_set2, channel=channel)
-
-    # For checking netODs, we can also plot 2D images, just to check them:
-    results_by_image_netod_set1 = analyze_simple_image(
-        pre_image_set1, post_image_set1, channel=channel)
-    results_by_image_netod_set2 = analyze_simple_image(
-        pre_image_set2, post_image_set2, channel=channel)
-
-    # Plot the full-image dose map
-    plot_results(results_by_image_netod_set1, dpi=300,
-                 pixel_size=0.1, rois=roi_post_set1.rois, vmax=1.0)  # Caveat: units are NetOD
-    plot_results(results_by_image_netod_set2, dpi=300,
-                 pixel_size=0.1, rois=roi_post_set2.rois, vmax=1.0)  # Caveat: units are NetOD
+    results_by_roi_set1, results_by_image_netod_set1, roi_post_set1 = analyze_set(
+        data_dir, pre_filenames_set1, post_filenames_set1, roi_pre_filename_set1, roi_post_filename_set1, channel)
+    results_by_roi_set2, results_by_image_netod_set2, roi_post_set2 = analyze_set(
+        data_dir, pre_filenames_set2, post_filenames_set2, roi_pre_filename_set2, roi_post_filename_set2, channel)
+
+    # Plot the full-image NetOD maps of both sets side by side, in a single figure
+    fig, (ax_set1, ax_set2) = plt.subplots(1, 2, figsize=(12, 4.8))
+    plot_image_results(results_by_image_netod_set1, dpi=300,
+                       pixel_size=0.1, rois=roi_post_set1.rois, vmax=1.0, ax=ax_set1, label="NetOD []")
+    plot_image_results(results_by_image_netod_set2, dpi=300,
+                       pixel_size=0.1, rois=roi_post_set2.rois, vmax=1.0, ax=ax_set2, label="NetOD []")
+    plt.show()
+    plt.close(fig)
+    # The NetOD maps are not needed for the calibration, release them before fitting and plotting it
+    del results_by_image_netod_set1, results_by_image_netod_set2
 
     doses = doses_set1 + doses_set2
     netODs = results_by_roi_set1 + results_by_roi_set2
     # Create a Calibration object and save it
     calib = Calibration(ds=doses, nods=netODs, lot="03172103",
                         channel=CHANNEL_MAP[channel])
-    calib_fn = f"resources/ebt_calibration_lot03172103_{CHANNEL_MAP[channel]}_simple.pkl"
+    calib_fn = f"resources/ebt_calibration_lot03172103_{CHANNEL_MAP[channel]}_simple.npz"
     calib.save(filename=calib_fn)
     logger.info(f"Calibration saved as {calib_fn}")
 
@@ -134,65 +108,43 @@ def main(args=None):
     calib.plot()
 
 
-# first 4 scans of pre-irradiation images.
-
-def plot_results(results, dpi, pixel_size, plot_type="image", save=None, rois=None, vmax=None):
+def analyze_set(data_dir, pre_filenames, post_filenames, roi_pre_filename, roi_post_filename, channel):
     """
-    Function to plot results of the analysis.
+    Loads the pre- and post-irradiation scans of one set of films and calculates their NetOD.
+
+    The images are released when the function returns, only the (much smaller) results are kept.
 
     Args:
-        results (np.ndarray or list): The results to plot. Can be either a 2D array for full-image analysis
-                                      or a list of values for ROI-based analysis.
-        dpi (float): The dots per inch (DPI) resolution of the scan.
-        pixel_size (float): The size of each pixel in millimeters.
-        plot_type (str): Either "image" for 2D analysis or "roi" for ROI-based analysis.
-        save (str, optional): If provided, the plot will be saved to the given filename instead of being displayed.
+        data_dir (str): Directory of the scans and ROI files.
+        pre_filenames (list): Filenames of the pre-irradiation scans, which are averaged.
+        post_filenames (list): Filenames of the post-irradiation scans, which are averaged.
+        roi_pre_filename (str): Filename of the ImageJ ROIs of the pre-irradiation scans.
+        roi_post_filename (str): Filename of the ImageJ ROIs of the post-irradiation scans.
+        channel (int): Color channel to analyze.
+
+    Returns:
+        tuple: NetOD per ROI (list), full-image NetOD map (np.ndarray) and the ROI object of the post-irradiation scans.
     """
+    # Load images
+    pre_image = RSImage([os.path.join(data_dir, fn) for fn in pre_filenames])
+    post_image = RSImage([os.path.join(data_dir, fn) for fn in post_filenames])
+
+    # Load ROIs and attach the ROI tuple lists to the images:
+    roi_pre = ROI(os.path.join(data_dir, roi_pre_filename))
+    roi_post = ROI(os.path.join(data_dir, roi_post_filename))
+    pre_image.rois = roi_pre.rois
+    post_image.rois = roi_post.rois
 
-    # TODO: Convert pixel indices to mm using the pixel size
-    # height_in_mm = results.shape[0] * pixel_size
-    # width_in_mm = results.shape[1] * pixel_size
-
-    if not vmax:
-        vmax = results.max()  # TODO: eliminate NaN values from results array
-
-    if plot_type == "image":
-        # Plot the full 2D dose map with proper vmin and vmax
-        plt.imshow(results, vmin=0, vmax=vmax, cmap="gist_ncar")
-        cb = plt.colorbar()
-        cb.set_label("NetOD []")
-
-        plt.xlabel("X axis [pixels]")
-        plt.ylabel("Y axis [pixels]")
-        # TODO: set axis scales to mm instead of pixels
-        plt.title("Dose Distribution")
-        plt.gca().set_aspect('auto')
-        # Plot ROI rectangles
-        if rois:
-            for idx, (xmin, xmax, ymin, ymax) in enumerate(rois):
-                rect = patches.Rectangle((xmin, ymin), xmax - xmin, ymax - ymin,
-                                         linewidth=2, edgecolor='r', facecolor='none')
-                plt.gca().add_patch(rect)
-                # Add ROI index to the center of the rectangle
-                plt.text((xmin + xmax) / 2, (ymin + ymax) / 2, f"ROI {idx+1}",
-                         color='red', ha='center', va='center', fontsize=8, fontweight='bold')
-
-    elif plot_type == "roi":
-        # Plot ROI-based dose results as a bar chart
-        plt.bar(range(len(results)), results)
-        plt.xlabel("ROI Index")
-        plt.ylabel("Dose [Gy]")
-        plt.title("Dose per ROI")
-    else:
-        logger.error(f"Unknown plot_type: {plot_type}")
-        return
-
-    # Save plot to file if filename is provided, else display it
-    if save:
-        plt.savefig(save, dpi=dpi, bbox_inches='tight')
-        logger.info(f"Plot saved as {save}")
-    else:
-        plt.show()
+    # First we do a simple analysis by ROI, which means, each ROI an average netOD is calculated.
+    results_by_roi = analyze_simple_roi(pre_image, post_image, channel=channel)
+
+    # For checking netODs, we can also plot 2D images, just to check them:
+    results_by_image_netod = analyze_simple_image(pre_image, post_image, channel=channel)
+
+    return results_by_roi, results_by_image_netod, roi_post
+
+
+# first 4 scans of pre-irradiation images.
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+"""
+Plotting helpers shared by the example scripts (example_01.py, example_02.py, example_03.py).
+"""
+import logging
+
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+from matplotlib.collections import PatchCollection
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
+
+logger = logging.getLogger(__name__)
+
+
+def plot_results(results, dpi, pixel_size, plot_type="image", save=None, rois=None, vmax=None, ax=None, quick=False,
+                 label="Dose [Gy]"):
+    """
+    Function to plot results of the analysis.
+
+    Dispatches to plot_image_results() or plot_roi_results(), which can also be called directly.
+
+    Args:
+        results (np.ndarray or list): The results to plot. Can be either a 2D array for full-image analysis
+                                      or a list of values for ROI-based analysis.
+        dpi (float): The dots per inch (DPI) resolution of the scan.
+        pixel_size (float): The size of each pixel in millimeters.
+        plot_type (str): Either "image" for 2D analysis or "roi" for ROI-based analysis.
+        save (str, optional): If provided, the plot will be saved to the given filename instead of being displayed.
+        ax (matplotlib.axes.Axes, optional): Axes to draw into, e.g. to show several results in one figure.
+                                             The figure is then only saved (if `save` is given), but not displayed.
+        quick (bool, optional): See plot_image_results().
+        label (str, optional): See plot_image_results().
+    """
+    if plot_type == "image":
+        plot_image_results(results, dpi, pixel_size, save=save, rois=rois, vmax=vmax, ax=ax, quick=quick, label=label)
+    elif plot_type == "roi":
+        plot_roi_results(results, dpi, save=save, ax=ax)
+    else:
+        logger.error(f"Unknown plot_type: {plot_type}")
+
+
+def plot_image_results(results, dpi, pixel_size, save=None, rois=None, vmax=None, ax=None, quick=False,
+                       label="Dose [Gy]"):
+    """
+    Plots the 2D map of a full-image analysis, with optional ROI rectangles.
+
+    Args:
+        results (np.ndarray): 2D array of the results.
+        dpi (float): The dots per inch (DPI) resolution of the scan.
+        pixel_size (float): The size of each pixel in millimeters.
+        save (str, optional): If provided, the plot will be saved to the given filename instead of being displayed.
+        rois (list, optional): ROIs (xmin, xmax, ymin, ymax) to draw on the map.
+        vmax (float, optional): Upper limit of the colour scale. Defaults to the maximum of the (finite) results.
+        ax (matplotlib.axes.Axes, optional): Axes to draw into, e.g. to show several results in one figure.
+                                             The figure is then only saved (if `save` is given), but not displayed.
+        quick (bool, optional): If True, a map without ROIs which is saved is written directly as colour-mapped
+                                image of about the size of a default figure saved at `dpi`, without axes and colorbar.
+                                Meant for quick checks.
+        label (str, optional): Label of the colorbar, i.e. the quantity and unit of the results.
+                               Defaults to "Dose [Gy]".
+    """
+
+    # TODO: Convert pixel indices to mm using the pixel size
+    # height_in_mm = results.shape[0] * pixel_size
+    # width_in_mm = results.shape[1] * pixel_size
+
+    if not vmax:
+        vmax = np.nanmax(results)  # NaN values (e.g. saturated pixels) are ignored
+
+    if quick and save and not rois:
+        level, _ = pyramid_level(results, max(plt.rcParams["figure.figsize"]) * dpi)
+        imsave(save, level, vmin=0, vmax=vmax, cmap="gist_ncar", **_png_kwargs(save))
+        logger.info(f"Map saved as {save}")
+        return
+
+    fig, ax, show = _figure_axes(save, ax)
+
+    # Plot the 2D dose map with proper vmin and vmax.
+    # Only a level of a factor-2 image pyramid matching the rendered resolution (the save dpi for saved figures)
+    # is drawn, instead of letting matplotlib resample the full-resolution map on every draw. The extent keeps
+    # full-resolution pixel coordinates on the axes, so the ROI rectangles stay in place.
+    level, factor = pyramid_level(results, max(fig.get_size_inches()) * (dpi if save else fig.dpi))
+    # area covered by the level (odd rows and columns are dropped when pooling)
+    height, width = level.shape[0] * factor, level.shape[1] * factor
+    im = ax.imshow(level, vmin=0, vmax=vmax, cmap="gist_ncar", extent=(-0.5, width - 0.5, height - 0.5, -0.5))
+    cb = fig.colorbar(im, ax=ax)
+    cb.set_label(label)
+
+    ax.set_xlabel("X axis [pixels]")
+    ax.set_ylabel("Y axis [pixels]")
+    # TODO: set axis scales to mm instead of pixels
+    ax.set_title("Dose Distribution")
+    ax.set_aspect('auto')
+    # Plot ROI rectangles
+    if rois:
+        # All rectangles as a single collection, drawn in one go instead of one artist per ROI
+        rects = [patches.Rectangle((xmin, ymin), xmax - xmin, ymax - ymin) for xmin, xmax, ymin, ymax in rois]
+        ax.add_collection(PatchCollection(rects, linewidth=2, edgecolor='r', facecolor='none'))
+        # Add ROI index to the center of each rectangle
+        rois_arr = np.asarray(rois)
+        centers_x = (rois_arr[:, 0] + rois_arr[:, 1]) / 2
+        centers_y = (rois_arr[:, 2] + rois_arr[:, 3]) / 2
+        for idx, (x, y) in enumerate(zip(centers_x.tolist(), centers_y.tolist())):
+            ax.text(x, y, f"ROI {idx+1}", color='red', ha='center', va='center', fontsize=8, fontweight='bold')
+
+    _save_or_show(fig, save, dpi, show)
+
+
+def plot_roi_results(results, dpi, save=None, ax=None):
+    """
+    Plots the results of an ROI-based analysis as a bar chart.
+
+    Args:
+        results (list): One value per ROI.
+        dpi (float): The dots per inch (DPI) resolution of the saved plot.
+        save (str, optional): If provided, the plot will be saved to the given filename instead of being displayed.
+        ax (matplotlib.axes.Axes, optional): Axes to draw into, e.g. to show several results in one figure.
+                                             The figure is then only saved (if `save` is given), but not displayed.
+    """
+    fig, ax, show = _figure_axes(save, ax)
+
+    # Plot ROI-based dose results as a bar chart
+    ax.bar(range(len(results)), results)
+    ax.set_xlabel("ROI Index")
+    ax.set_ylabel("Dose [Gy]")
+    ax.set_title("Dose per ROI")
+
+    _save_or_show(fig, save, dpi, show)
+
+
+def _figure_axes(save, ax):
+    """
+    Returns the figure and axes to plot into, and whether the figure is to be displayed.
+
+    A plot which is only saved is drawn on a bare Figure, rendered by the Agg canvas when saved to an image file:
+    this does not start the interactive (Qt, Tk) backend, and also works on headless machines.
+    """
+    if ax is not None:
+        return ax.figure, ax, False
+    fig = Figure() if save else plt.figure()
+    return fig, fig.add_subplot(), not save
+
+
+def _save_or_show(fig, save, dpi, show):
+    """
+    Saves the figure to file if a filename is provided, else displays it (if `show` is True).
+    """
+    if save:
+        fig.savefig(save, dpi=dpi, bbox_inches='tight', **_png_kwargs(save))
+        logger.info(f"Plot saved as {save}")
+    elif show:
+        plt.show()
+        # Release the figure and its image data: without a GUI, show() returns at once and figures would accumulate
+        plt.close(fig)
+
+
+def _png_kwargs(filename):
+    """
+    Returns the savefig arguments for a fast zlib level for PNG files: several times faster to write,
+    for a slightly larger file.
+    """
+    return {"pil_kwargs": {"compress_level": 1}} if filename.lower().endswith(".png") else {}
+
+
+def pyramid_level(image, size):
+    """
+    Returns the coarsest level of a factor-2 image pyramid (see mean_pool2) which still has about `size` pixels,
+    i.e. at most twice as many, along its longer side.
+
+    Args:
+        image (np.ndarray): 2D array.
+        size (float): Number of pixels the level is displayed on, along the longer side.
+
+    Returns:
+        tuple: The level (np.ndarray) and its downsampling factor (int), 1 for the image itself.
+    """
+    level = np.asarray(image)
+    factor = 1
+    while max(level.shape) > 2 * size:
+        level = mean_pool2(level)
+        factor *= 2
+    return level, factor
+
+
+def mean_pool2(image):
+    """
+    Halves the resolution of a 2D image by averaging blocks of 2 x 2 pixels, ignoring NaN and Inf pixels.
+
+    Unlike taking every second pixel, this keeps isolated hot or cold pixels from dominating the coarse levels,
+    and the noise of the map is averaged out as it would be by eye. A last odd row or column is dropped.
+
+    Args:
+        image (np.ndarray): 2D array.
+
+    Returns:
+        np.ndarray: Array of half the size, NaN where all four pixels of a block are not finite.
+    """
+    h, w = image.shape[0] // 2, image.shape[1] // 2
+    blocks = image[:2 * h, :2 * w].reshape(h, 2, w, 2)
+    finite = np.isfinite(blocks)
+    sums = np.where(finite, blocks, 0).sum(axis=(1, 3))
+    counts = finite.sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums / counts).astype(image.dtype, copy=False)
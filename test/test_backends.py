@@ -0,0 +1,105 @@
+# test/test_backends.py
+
+import numpy as np
+import pytest
+
+from radscan import _kernels, netod, workflow
+from radscan import Calibration, NetOD, RSImage
+
+BACKENDS = ["numba", "numexpr", "numpy"]
+
+# Large enough for the full-image code paths (at least _kernels.MIN_SIZE pixels)
+RNG = np.random.default_rng(1)
+PVA = RNG.uniform(15000.0, 40000.0, size=(150, 200))
+IMAGE = RNG.integers(10000, 50000, size=(150, 200, 3), dtype=np.uint16)
+ROIS = [(0, 150, 0, 100), (40, 190, 30, 130), (5, 25, 10, 20)]
+CALC_ARGS = (41000.0, 40200.0, 150.0, 12.0, 0.0, 9.0, 11.0, 4.0)
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    """
+    Selects the Numba, numexpr or NumPy code paths, skipping backends which are not installed.
+    """
+    if request.param == "numba" and not _kernels.HAVE_NUMBA:
+        pytest.skip("Numba not installed")
+    if request.param == "numexpr" and not netod.HAVE_NUMEXPR:
+        pytest.skip("numexpr not installed")
+    if request.param != "numba":
+        monkeypatch.setattr(_kernels, "HAVE_NUMBA", False)
+    if request.param == "numpy":
+        monkeypatch.setattr(netod, "HAVE_NUMEXPR", False)
+    return request.param
+
+
+def numpy_reference(func, *args, **kwargs):
+    """
+    Returns func(*args, **kwargs) evaluated with the NumPy code paths.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(_kernels, "HAVE_NUMBA", False)
+        mp.setattr(netod, "HAVE_NUMEXPR", False)
+        return func(*args, **kwargs)
+
+
+@pytest.fixture
+def calibration():
+    return Calibration.from_fitparams([5.8, 49.9, 2.61])
+
+
+def test_simple(backend):
+    dn, sn = NetOD.simple(42000.0, PVA, 15.0, 8.0)
+    dn_ref, sn_ref = numpy_reference(NetOD.simple, 42000.0, PVA, 15.0, 8.0)
+    assert dn.shape == sn.shape == PVA.shape
+    assert np.allclose(dn, dn_ref, rtol=1e-6, atol=1e-9)
+    assert np.allclose(sn, sn_ref, rtol=1e-6)
+
+
+def test_calc(backend):
+    dn, sn = NetOD.calc(42000.0, PVA, *CALC_ARGS)
+    dn_ref, sn_ref = numpy_reference(NetOD.calc, 42000.0, PVA, *CALC_ARGS)
+    assert np.allclose(dn, dn_ref, rtol=1e-6, atol=1e-9)
+    assert np.allclose(sn, sn_ref, rtol=1e-6)
+
+
+def test_dose(backend, calibration):
+    nods = np.linspace(0.0, 1.0, PVA.size).reshape(PVA.shape)
+    for x in (nods, nods.astype(np.float32)):
+        dose = calibration.dose(x)
+        assert dose.dtype == x.dtype
+        assert np.allclose(dose, numpy_reference(calibration.dose, x), rtol=1e-5)
+
+
+def test_roi_stats(backend):
+    image = RSImage.__new__(RSImage)
+    image.image = IMAGE
+    for rois in (ROIS, ROIS[:2]):
+        for channel in (0, 2):
+            stats = image.roi_stats(rois, channel)
+            stats_ref = numpy_reference(image.roi_stats, rois, channel)
+            for values, values_ref in zip(stats, stats_ref):
+                assert values.dtype == values_ref.dtype
+                assert np.allclose(values, values_ref, rtol=1e-9)
+
+
+@pytest.mark.parametrize("netod_func, args", [(NetOD.simple, ()), (NetOD.calc, CALC_ARGS)])
+def test_image_map(backend, calibration, netod_func, args):
+    pva = PVA.astype(np.float32)
+    for cal in (None, calibration):
+        result = workflow._image_map(netod_func, 42000.0, pva, *args, calibration=cal)
+        expected = numpy_reference(workflow._image_map, netod_func, 42000.0, pva, *args, calibration=cal)
+        assert result.dtype == np.float32
+        assert np.allclose(result, expected, rtol=1e-5, atol=1e-7)
+
+
+def test_roi_stats_nan(backend):
+    """
+    A NaN pixel makes all statistics of its ROI NaN, with every backend.
+    """
+    image = RSImage.__new__(RSImage)
+    image.image = IMAGE.astype(np.float32)
+    image.image[5, 140, 0] = np.nan  # in the first ROI only
+    for rois in (ROIS, ROIS[:2]):
+        means, stderrs, minvals, maxvals = image.roi_stats(rois)
+        for values in (means, stderrs, minvals, maxvals):
+            assert np.isnan(values[0]) and not np.isnan(values[1:]).any()
@@ -0,0 +1,121 @@
+# test/test_calibration.py
+
+import pickle
+
+import numpy as np
+import pytest
+
+from radscan import Calibration
+
+DS = [0.0, 2.0, 4.0, 8.0, 12.0, 20.0]
+NODS = [0.0, 0.0868, 0.1525, 0.2492, 0.3207, 0.4240]
+
+
+def test_fit():
+    """
+    The analytic Jacobian reproduces the calibration points.
+    """
+    cal = Calibration(DS, NODS)
+    assert np.allclose(cal.dose(np.array(NODS)), DS, atol=0.2)
+
+
+def test_fit_negative_netod_raises():
+    """
+    A negative NetOD makes the fit fail instead of silently returning the initial guess.
+    """
+    nods = list(NODS)
+    nods[1] = -0.001
+    with pytest.raises(RuntimeError):
+        Calibration(DS, nods)
+
+
+@pytest.mark.parametrize("c", [2.0, 3.0, 4.0])
+def test_dose_integer_exponent(c):
+    """
+    Integer exponents, evaluated by multiplication, give the same dose as the power.
+    """
+    cal = Calibration(DS, NODS)
+    cal.fitparams = np.array([5.8, 49.9, c])
+    netod = np.linspace(0.0, 1.0, 101)
+    assert np.allclose(cal.dose(netod), 5.8 * netod + 49.9 * netod ** c, rtol=1e-12)
+
+
+@pytest.mark.parametrize("out", [np.empty((50, 400))[:, ::2], np.empty((200, 100)), np.empty((100, 200), dtype=int)])
+def test_dose_rejects_bad_out(out):
+    """
+    An output array the result cannot be written into directly is rejected instead of silently left unwritten.
+    """
+    cal = Calibration(DS, NODS)
+    with pytest.raises(ValueError):
+        cal.dose(np.full((100, 200), 0.2), out=out)
+
+
+def test_dose_out():
+    cal = Calibration(DS, NODS)
+    netod = np.full((100, 200), 0.2)
+    out = np.empty((100, 200), dtype=np.float32)
+    assert cal.dose(netod, out=out) is out
+    assert np.allclose(out, cal.dose(0.2))
+
+
+def test_dose_scalar():
+    """
+    Scalar doses are np.float64 and follow NumPy for values outside the domain of math.pow.
+    """
+    cal = Calibration(DS, NODS)
+    dose = cal.dose(0.2)
+    assert isinstance(dose, np.float64)
+    assert np.isclose(dose, cal.dose(np.array([0.2]))[0])
+    with np.errstate(over="ignore", invalid="ignore"):
+        assert cal.dose(1e200) == np.inf
+        assert np.isnan(cal.dose(-0.1))
+
+
+def check_equal(loaded, cal):
+    assert isinstance(loaded, Calibration)
+    assert np.array_equal(loaded.fitparams, cal.fitparams)
+    assert np.array_equal(loaded.ds, cal.ds) and np.array_equal(loaded.nods, cal.nods)
+    assert (loaded.lot, loaded.date, loaded.channel) == (cal.lot, cal.date, cal.channel)
+    assert loaded.fitstr == cal.fitstr
+
+
+def test_save_load(tmp_path):
+    """
+    Calibrations are saved as .npz archives and loaded without refitting.
+    """
+    cal = Calibration(DS, NODS, lot="03172103", date="2024-03-17", channel="RED")
+    filename = tmp_path / "calibration.npz"
+    cal.save(filename)
+    check_equal(Calibration.load(filename), cal)
+
+
+def test_load_legacy_pickle(tmp_path):
+    """
+    Pickled calibrations of the former top-level 'calibration' module are still loaded.
+    """
+    cal = Calibration(DS, NODS, lot="03172103", date="2024-03-17", channel="RED")
+    # Protocol 0 stores the class as a text line, which is renamed to the old module here
+    data = pickle.dumps(cal, protocol=0).replace(b"radscan.calibration\n", b"calibration\n")
+    filename = tmp_path / "calibration.pkl"
+    filename.write_bytes(data)
+    loaded = Calibration.load(filename)
+    check_equal(loaded, cal)
+    assert np.allclose(loaded.dose(np.array(NODS)), cal.dose(np.array(NODS)))
+
+
+def test_load_invalid(tmp_path):
+    filename = tmp_path / "calibration.npz"
+    np.savez(filename, ds=np.array(DS))
+    with pytest.raises(ValueError):
+        Calibration.load(filename)
+
+
+def test_from_fitparams():
+    """
+    A calibration built from its fit parameters converts NetOD to the same dose as the fitted one.
+    """
+    cal = Calibration(DS, NODS)
+    other = Calibration.from_fitparams(cal.fitparams)
+    assert np.array_equal(other.fitparams, cal.fitparams)
+    assert other.fitstr == cal.fitstr
+    assert np.array_equal(other.dose(np.array(NODS)), cal.dose(np.array(NODS)))
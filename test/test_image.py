@@ -0,0 +1,151 @@
+# test/test_image.py
+
+import logging
+import os
+
+import numpy as np
+import pytest
+import tifffile
+
+from radscan import RSImage
+
+RNG = np.random.default_rng(2)
+
+
+def write_scans(tmp_path, n=3):
+    filenames = []
+    for i in range(n):
+        filename = str(tmp_path / f"scan_{i}.tif")
+        tifffile.imwrite(filename, RNG.integers(0, 65535, size=(60, 80, 3), dtype=np.uint16), photometric="rgb")
+        filenames.append(filename)
+    return filenames
+
+
+def test_average(tmp_path):
+    filenames = write_scans(tmp_path)
+    image = RSImage(filenames)
+    expected = np.mean([tifffile.imread(fn) for fn in filenames], axis=0)
+    assert image.image.dtype == np.float32
+    assert np.allclose(image.image, expected, rtol=1e-6)
+    assert image.channel(1).flags.c_contiguous
+
+
+def test_average_many_files(tmp_path):
+    """
+    Averages of many files are as accurate as those of a few.
+    """
+    filenames = write_scans(tmp_path, n=20)
+    image = RSImage(filenames)
+    expected = np.mean([tifffile.imread(fn) for fn in filenames], axis=0)
+    assert np.allclose(image.image, expected, rtol=1e-6)
+
+
+def test_cache_dir(tmp_path):
+    """
+    The average is cached on first use, reused by later loads, and recomputed when a file changes.
+    """
+    filenames = write_scans(tmp_path)
+    cache_dir = tmp_path / "cache"
+    expected = RSImage(filenames).image
+
+    first = RSImage(filenames, cache_dir=str(cache_dir))
+    assert np.array_equal(first.image, expected)
+    cache_files = os.listdir(cache_dir)
+    assert len(cache_files) == 1 and cache_files[0].endswith(".npy")
+
+    second = RSImage(filenames, cache_dir=str(cache_dir))
+    assert isinstance(second.image.base, np.memmap)
+    assert np.array_equal(second.image, expected)
+    assert np.array_equal(second.channel(2), expected[:, :, 2])
+    assert os.listdir(cache_dir) == cache_files
+
+    tifffile.imwrite(filenames[0], np.zeros((60, 80, 3), dtype=np.uint16), photometric="rgb")
+    stat = os.stat(filenames[0])
+    os.utime(filenames[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    changed = RSImage(filenames, cache_dir=str(cache_dir))
+    assert np.array_equal(changed.image, RSImage(filenames).image)
+    assert not np.array_equal(changed.image, expected)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_single_file_memmap(tmp_path):
+    """
+    A single uncompressed file is memory-mapped copy-on-write: it can be modified in place, the file is unchanged.
+    """
+    filename = str(tmp_path / "scan.tif")
+    data = RNG.integers(1, 65535, size=(60, 80, 3), dtype=np.uint16)
+    tifffile.imwrite(filename, data, photometric="rgb")
+    image = RSImage(filename)
+    assert isinstance(image.image, np.memmap)
+    assert np.array_equal(image.image, data)
+    image.image -= 1
+    image.image[0, 0] = 0
+    assert np.array_equal(image.image[1:], data[1:] - 1)
+    assert np.array_equal(tifffile.imread(filename), data)
+
+
+def test_single_file_not_contiguous(tmp_path):
+    """
+    Uncompressed pages which are not stored contiguously cannot be memory-mapped, and are read instead.
+    """
+    filename = str(tmp_path / "scan.tif")
+    data = RNG.integers(0, 65535, size=(60, 80), dtype=np.uint16)
+    tifffile.imwrite(filename, data, metadata=None)
+    tifffile.imwrite(filename, data + 1, metadata=None, append=True)
+    image = RSImage(filename)
+    assert not isinstance(image.image, np.memmap)
+    assert np.array_equal(image.image, tifffile.imread(filename))
+
+
+def test_single_file_compressed(tmp_path):
+    filename = str(tmp_path / "scan.tif")
+    data = RNG.integers(0, 65535, size=(60, 80, 3), dtype=np.uint16)
+    tifffile.imwrite(filename, data, photometric="rgb", compression="zlib", tile=(16, 16))
+    image = RSImage(filename)
+    assert not isinstance(image.image, np.memmap)
+    assert np.array_equal(image.image, data)
+
+
+def test_metadata(tmp_path, caplog):
+    """
+    The metadata is read on first access, only the whitelisted tags are extracted, and it can be replaced.
+    """
+    caplog.set_level(logging.INFO)  # debug logging prints the metadata
+    image = RSImage(write_scans(tmp_path, n=1)[0])
+    assert image._metadata is None
+    assert image.metadata["ImageWidth"] == 80 and image.metadata["ImageLength"] == 60
+    assert "StripOffsets" not in image.metadata
+    image.metadata = {"Make": "scanner"}
+    assert image.metadata == {"Make": "scanner"}
+
+
+def test_check_rois(tmp_path):
+    image = RSImage(write_scans(tmp_path, n=1)[0], rois=[(0, 10, 0, 10), (70, 90, 0, 10)])
+    with pytest.raises(ValueError):
+        image.analyze()
+
+
+def test_with_rois(tmp_path):
+    image = RSImage(write_scans(tmp_path, n=1)[0], rois=[(0, 10, 0, 10)])
+    other = image.with_rois([(10, 20, 0, 10)])
+    assert other.image is image.image
+    assert other.rois == [(10, 20, 0, 10)] and image.rois == [(0, 10, 0, 10)]
+
+
+def test_roi_means(tmp_path):
+    image = RSImage(write_scans(tmp_path, n=1)[0], rois=[(0, 10, 0, 10), (10, 30, 20, 50)])
+    for channel in (0, 2):
+        assert np.array_equal(image.roi_means(channel=channel), image.roi_stats(channel=channel)[0])
+
+
+def test_channel(tmp_path):
+    """
+    Channels of interleaved images are contiguous copies, made once.
+    """
+    filename = str(tmp_path / "scan.tif")
+    data = RNG.integers(0, 65535, size=(60, 80, 3), dtype=np.uint16)
+    tifffile.imwrite(filename, data, photometric="rgb")
+    image = RSImage(filename)
+    red = image.channel(0)
+    assert red.flags.c_contiguous and np.array_equal(red, data[:, :, 0])
+    assert image.channel(0) is red
@@ -0,0 +1,98 @@
+# test/test_netod.py
+
+import numpy as np
+import pytest
+
+from radscan import _kernels, netod
+from radscan import NetOD
+
+PVA = np.linspace(20000.0, 40000.0, 100 * 200).reshape(100, 200)
+
+
+def test_simple_formula():
+    dn, sn = NetOD.simple(42000.0, PVA, 15.0, 8.0)
+    assert np.allclose(dn, np.log10(42000.0 / PVA), rtol=1e-12)
+    assert np.allclose(sn, np.sqrt((15.0 / 42000.0) ** 2 + (8.0 / PVA) ** 2) / np.log(10.0), rtol=1e-12)
+
+
+@pytest.mark.parametrize("pvbk, spvbk", [(0.0, 0.0), (150.0, 4.0)])
+def test_calc_formula(pvbk, spvbk):
+    """
+    NetOD.calc agrees with the textbook formula, with and without a background.
+    """
+    pvb, pvcb, pvca, spvb, spva, spvcb, spvca = 42000.0, 41000.0, 40200.0, 12.0, 9.0, 11.0, 6.0
+    dn, sn = NetOD.calc(pvb, PVA, pvcb, pvca, pvbk, spvb, spva, spvcb, spvca, spvbk)
+    pvb_bk, pva_bk, pvcb_bk, pvca_bk = pvb - pvbk, PVA - pvbk, pvcb - pvbk, pvca - pvbk
+    expected = np.log10(pvb_bk / pva_bk) - np.log10(pvcb_bk / pvca_bk)
+    variance = ((spvb / pvb_bk) ** 2 + (spva / pva_bk) ** 2 + (spvcb / pvcb_bk) ** 2 + (spvca / pvca_bk) ** 2
+                + (pvb - PVA) ** 2 / (pvb_bk * pva_bk) ** 2 * spvbk ** 2
+                + (pvcb - pvca) ** 2 / (pvcb_bk * pvca_bk) ** 2 * spvbk ** 2)
+    assert np.allclose(dn, expected, rtol=1e-9, atol=1e-12)
+    assert np.allclose(sn, np.sqrt(variance) / np.log(10.0), rtol=1e-9)
+
+
+def test_float32_storage():
+    """
+    Pixel value arrays are stored as float32, scalars as they are.
+    """
+    obj = NetOD(42000.0, PVA, spvb=10.0, spva=np.full(PVA.shape, 5.0), simplified=True)
+    assert obj.pva.dtype == obj.spva.dtype == np.float32
+    dn, _ = obj.dnetOD()
+    assert np.allclose(dn, np.log10(42000.0 / PVA), rtol=1e-5)
+
+
+def test_calc_out():
+    out, sout = np.empty(PVA.shape), np.empty(PVA.shape)
+    args = (41000.0, 40500.0, 100.0, 10.0, 5.0, 10.0, 10.0, 2.0)
+    dn, sn = NetOD.calc(42000.0, PVA, *args, out=out, sout=sout)
+    assert dn is out and sn is sout
+    dn_ref, sn_ref = NetOD.calc(42000.0, PVA, *args)
+    assert np.allclose(out, dn_ref) and np.allclose(sout, sn_ref)
+
+
+def test_compute_stderr():
+    dn, sn = NetOD.simple(42000.0, PVA, compute_stderr=False)
+    assert sn is None and np.allclose(dn, NetOD.simple(42000.0, PVA)[0])
+    dn, sn = NetOD.calc(42000.0, PVA, 41000.0, 40500.0, 100.0, 0, 0, 0, 0, 0, compute_stderr=False)
+    assert sn is None and np.allclose(dn, NetOD.calc(42000.0, PVA, 41000.0, 40500.0, 100.0, 0, 0, 0, 0, 0)[0])
+
+
+@pytest.mark.parametrize("out", [np.empty((50, 400)), np.empty((100, 400))[:, ::2], np.empty((100, 200), dtype=int)])
+def test_simple_rejects_bad_out(out):
+    with pytest.raises(ValueError):
+        NetOD.simple(42000.0, PVA, out=out)
+
+
+@pytest.mark.parametrize("out", [np.empty((50, 400)), np.empty((100, 400))[:, ::2]])
+def test_calc_rejects_bad_out(out):
+    with pytest.raises(ValueError):
+        NetOD.calc(42000.0, PVA, 41000.0, 40500.0, 100.0, 0, 0, 0, 0, 0, out=out)
+
+
+def test_scalar_attributes():
+    """
+    Python and NumPy scalars are stored as they are, other values as arrays.
+    """
+    netod = NetOD(np.float32(42000.0), PVA, pvcb=41000, pvca=[40500.0, 40400.0], pvbk=np.int64(100))
+    assert type(netod.pvb) is np.float32
+    assert type(netod.pvcb) is int
+    assert isinstance(netod.pvca, np.ndarray)
+    assert type(netod.pvbk) is np.int64
+
+
+@pytest.mark.parametrize("simplified", [True, False])
+def test_dnetod_float32_images(monkeypatch, simplified):
+    """
+    Images are stored as float32, but NetOD is computed in float64: ratios close to 1 (low doses) keep their digits.
+    """
+    monkeypatch.setattr(_kernels, "HAVE_NUMBA", False)
+    monkeypatch.setattr(netod, "HAVE_NUMEXPR", False)
+    pva = np.linspace(41900.0, 42000.0, 100 * 200).reshape(100, 200)
+    spva = np.full(pva.shape, 5.0)
+    obj = NetOD(42000.0, pva, 41000.0, 41000.0, 0.0, 10.0, spva, 0, 0, 0, simplified=simplified)
+    assert obj.pva.dtype == obj.spva.dtype == np.float32
+    dn, sn = obj.dnetOD()
+    assert dn.dtype == sn.dtype == np.float32
+    pva32 = obj.pva.astype(float)
+    assert np.allclose(dn, np.log10(42000.0 / pva32), rtol=1e-6, atol=1e-12)
+    assert np.allclose(sn, np.sqrt((10.0 / 42000.0) ** 2 + (5.0 / pva32) ** 2) / np.log(10.0), rtol=1e-6)
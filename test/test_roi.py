@@ -0,0 +1,48 @@
+# test/test_roi.py
+
+import os
+
+import numpy as np
+import roifile
+
+from radscan import ROI
+
+
+def write_rois(filename, rois):
+    roifile.roiwrite(filename, [roifile.ImagejRoi(roitype=roifile.ROI_TYPE.RECT, name=str(i), left=left, right=right,
+                                                  top=top, bottom=bottom)
+                                for i, (left, right, top, bottom) in enumerate(rois)], mode="w")
+
+
+def test_load_rois(tmp_path):
+    """
+    ROI files are parsed once, into a read-only int32 array shared by all ROI objects of the file.
+    """
+    filename = str(tmp_path / "rois.zip")
+    write_rois(filename, [(10, 50, 20, 70), (5, 25, 5, 15)])
+    roi = ROI(filename)
+    assert roi.rois == [(10, 50, 20, 70), (5, 25, 5, 15)]
+    assert roi.rois_arr.dtype == np.int32 and not roi.rois_arr.flags.writeable
+    assert ROI(filename).rois_arr is roi.rois_arr
+
+
+def test_slices(tmp_path):
+    filename = str(tmp_path / "rois.zip")
+    write_rois(filename, [(10, 50, 20, 70), (5, 25, 5, 15)])
+    image = np.arange(100 * 80 * 3).reshape(100, 80, 3)
+    roi = ROI(filename)
+    for (left, right, top, bottom), slices in zip(roi.rois, roi.slices):
+        assert np.array_equal(image[slices], image[top:bottom, left:right])
+
+
+def test_changed_file(tmp_path):
+    """
+    A changed ROI file is parsed again.
+    """
+    filename = str(tmp_path / "rois.zip")
+    write_rois(filename, [(10, 50, 20, 70)])
+    assert ROI(filename).rois == [(10, 50, 20, 70)]
+    write_rois(filename, [(5, 25, 5, 15)])
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert ROI(filename).rois == [(5, 25, 5, 15)]
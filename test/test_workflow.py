@@ -0,0 +1,141 @@
+# test/test_workflow.py
+
+import os
+import threading
+
+import numpy as np
+import pytest
+import tifffile
+
+from radscan import _kernels, netod, workflow
+from radscan import Calibration, NetOD, RSImage
+
+LEVELS = np.array([40000.0, 30000.0, 20000.0])
+ROIS = [(10, 40, 10, 40), (60, 110, 50, 90)]
+
+
+def scan(tmp_path, name, scale, rng):
+    """
+    Writes a noisy RGB scan of LEVELS * scale, returns it as RSImage with ROIS and as float64 array.
+    """
+    data = (LEVELS * scale * rng.uniform(0.98, 1.02, size=(100, 120, 3))).astype(np.uint16)
+    filename = str(tmp_path / f"{name}.tif")
+    tifffile.imwrite(filename, data, photometric="rgb")
+    return RSImage(filename, rois=ROIS), data.astype(float)
+
+
+def roi_means(data):
+    return np.array([data[ymin:ymax, xmin:xmax].mean() for xmin, xmax, ymin, ymax in ROIS])
+
+
+def test_analyze_simple_roi(tmp_path):
+    """
+    The ROI NetODs and doses, computed in one call each, match NetOD computed by hand.
+    """
+    rng = np.random.default_rng(3)
+    (pre, pre_data), (post, post_data) = scan(tmp_path, "pre", 1.0, rng), scan(tmp_path, "post", 0.6, rng)
+    expected = np.log10(roi_means(pre_data[:, :, 0]) / roi_means(post_data[:, :, 0]))
+    assert np.allclose(workflow.analyze_simple_roi(pre, post), expected, rtol=1e-6)
+
+    calibration = Calibration([0.0, 2.0, 4.0, 8.0, 12.0, 20.0], [0.0, 0.0868, 0.1525, 0.2492, 0.3207, 0.4240])
+    calibration_file = str(tmp_path / "calibration.npz")
+    calibration.save(calibration_file)
+    dose = workflow.analyze_simple_roi(pre, post, calibration_file=calibration_file)
+    assert len(dose) == len(ROIS)
+    assert np.allclose(dose, [calibration.dose(x) for x in expected], rtol=1e-9)
+
+
+def test_load_calibration(tmp_path):
+    """
+    Calibration files are loaded once, and again when they change.
+    """
+    calibration_file = str(tmp_path / "calibration.npz")
+    Calibration([0.0, 2.0, 4.0, 8.0], [0.0, 0.0868, 0.1525, 0.2492]).save(calibration_file)
+    calibration = workflow._load_calibration(calibration_file)
+    assert workflow._load_calibration(calibration_file) is calibration
+    stat = os.stat(calibration_file)
+    os.utime(calibration_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert workflow._load_calibration(calibration_file) is not calibration
+
+
+@pytest.mark.parametrize("have_numba", [True, False])
+def test_run_concurrently(monkeypatch, have_numba):
+    """
+    With Numba, only the calls which may use its kernels run in the calling thread, the others on the thread pool.
+    """
+    monkeypatch.setattr(_kernels, "HAVE_NUMBA", have_numba)
+    calls = [lambda i=i: (i, threading.get_ident()) for i in range(4)]
+    results = workflow._run_concurrently(*calls, kernels=(False, True, False, True))
+    assert [i for i, _ in results] == [0, 1, 2, 3]
+    in_thread = [ident == threading.get_ident() for _, ident in results]
+    assert in_thread == ([False, True, False, True] if have_numba else [False] * 4)
+
+    results = workflow._run_concurrently(*calls)
+    assert [i for i, _ in results] == [0, 1, 2, 3]
+    assert all(ident == threading.get_ident() for _, ident in results) == have_numba
+
+
+def test_background_stats(tmp_path):
+    """
+    Precomputed background statistics, or a plain background value, give the same NetOD as the background image.
+    """
+    rng = np.random.default_rng(4)
+    (pre, _), (post, _) = scan(tmp_path, "pre", 1.0, rng), scan(tmp_path, "post", 0.6, rng)
+    (control_pre, _), (control_post, _) = scan(tmp_path, "cpre", 1.0, rng), scan(tmp_path, "cpost", 0.97, rng)
+    background, _ = scan(tmp_path, "background", 0.01, rng)
+    stats = background.analyze(single=True)
+    for analyze in (workflow.analyze_roi, workflow.analyze_image):
+        expected = analyze(pre, post, control_pre, control_post, background)
+        for value in (stats, stats[0]):
+            assert np.allclose(analyze(pre, post, control_pre, control_post, value), expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("netod_func, args",
+                         [(NetOD.simple, ()), (NetOD.calc, (41000.0, 40500.0, 100.0, 0, 0, 0, 0, 0))])
+def test_image_map_strips_without_numexpr(monkeypatch, netod_func, args):
+    """
+    Without Numba, the image is mapped in strips on a thread pool, which must not call the multi-threaded numexpr.
+    """
+    numexpr = pytest.importorskip("numexpr")
+    monkeypatch.setattr(_kernels, "HAVE_NUMBA", False)
+    monkeypatch.setattr(netod, "HAVE_NUMEXPR", True)
+
+    def evaluate(*args, **kwargs):
+        raise AssertionError("numexpr called from the strip threads")
+
+    pva = np.linspace(20000.0, 40000.0, 600 * 400, dtype=np.float32).reshape(600, 400)
+    calibration = Calibration.from_fitparams([5.8, 49.9, 2.61])
+    expected, _ = netod_func(42000.0, pva.astype(float), *args, compute_stderr=False)
+    monkeypatch.setattr(numexpr, "evaluate", evaluate)
+    dose = workflow._image_map(netod_func, 42000.0, pva, *args, calibration=calibration)
+    assert np.allclose(dose, calibration.dose(expected), rtol=1e-6)
+
+
+@pytest.mark.parametrize("channel", [1, 2])
+def test_workflow_channels(tmp_path, channel):
+    """
+    All images of the workflows are analyzed in the requested channel, checked against NetOD computed by hand.
+    """
+    rng = np.random.default_rng(3)
+    (pre, pre_data), (post, post_data) = scan(tmp_path, "pre", 1.0, rng), scan(tmp_path, "post", 0.6, rng)
+    (control_pre, control_pre_data), (control_post, control_post_data) = (scan(tmp_path, "cpre", 1.0, rng),
+                                                                          scan(tmp_path, "cpost", 0.97, rng))
+    background, background_data = scan(tmp_path, "background", 0.01, rng)
+    post_data = post_data[:, :, channel]
+    pvb, pva = roi_means(pre_data[:, :, channel]), roi_means(post_data)
+    pvcb = roi_means(control_pre_data[:, :, channel]).mean()
+    pvca = roi_means(control_post_data[:, :, channel]).mean()
+    pvbk = roi_means(background_data[:, :, channel]).mean()
+
+    result = workflow.analyze_simple_roi(pre, post, channel=channel)
+    assert np.allclose(result, np.log10(pvb / pva), rtol=1e-6)
+
+    result = workflow.analyze_simple_image(pre, post, channel=channel)
+    assert np.allclose(result, np.log10(pvb.mean() / post_data), rtol=1e-5)
+
+    control = np.log10((pvcb - pvbk) / (pvca - pvbk))
+    result = workflow.analyze_roi(pre, post, control_pre, control_post, background, channel=channel)
+    assert np.allclose(result, np.log10((pvb - pvbk) / (pva - pvbk)) - control, rtol=1e-6)
+
+    result = workflow.analyze_image(pre, post, control_pre, control_post, background, channel=channel)
+    assert np.allclose(result, np.log10((pvb.mean() - pvbk) / (post_data - pvbk)) - control, rtol=1e-5, atol=1e-6)